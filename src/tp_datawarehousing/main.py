@@ -11,10 +11,9 @@ from tp_datawarehousing.steps import (
     step_09_update_dwh_with_ingesta2,
 )
 
-# Importar productos de datos individualmente
-from tp_datawarehousing.steps import step_10_1_ventas_mensuales_categoria_pais
-from tp_datawarehousing.steps import step_10_2_performance_empleados_trimestral
-from tp_datawarehousing.steps import step_10_3_analisis_logistica_shippers
+# Productos de datos (DP1, DP2, DP3) generados sobre una única conexión
+from tp_datawarehousing.steps import step_10_data_products
+from tp_datawarehousing.utils.quality_utils import close_metric_connection
 import logging
 import os
 
@@ -97,27 +96,16 @@ def main():
     step_09_update_dwh_with_ingesta2.main()
     logging.info("--- Paso 9: Finalizado ---")
 
-    # --- Paso 10.1: Crear DP1 - Ventas Mensuales por Categoría y País ---
+    # --- Paso 10: Crear Productos de Datos (DP1, DP2, DP3) ---
+    # Los tres se generan con una única conexión: la caché de páginas del DWH
+    # se reutiliza entre agregaciones
     logging.info(
-        "--- Ejecutando Paso 10.1: Creando DP1 - Ventas Mensuales por Categoría y País ---"
+        "--- Ejecutando Paso 10: Creando Productos de Datos (DP1, DP2, DP3) ---"
     )
-    step_10_1_ventas_mensuales_categoria_pais.main()
-    logging.info("--- Paso 10.1: Finalizado ---")
-
-    # --- Paso 10.2: Crear DP2 - Performance de Empleados Trimestral ---
-    logging.info(
-        "--- Ejecutando Paso 10.2: Creando DP2 - Performance de Empleados Trimestral ---"
-    )
-    step_10_2_performance_empleados_trimestral.main()
-    logging.info("--- Paso 10.2: Finalizado ---")
-
-    # --- Paso 10.3: Crear DP3 - Análisis de Logística y Shippers ---
-    logging.info(
-        "--- Ejecutando Paso 10.3: Creando DP3 - Análisis de Logística y Shippers ---"
-    )
-    step_10_3_analisis_logistica_shippers.main()
-    logging.info("--- Paso 10.3: Finalizado ---")
+    step_10_data_products.main()
+    logging.info("--- Paso 10: Finalizado ---")
 
+    close_metric_connection()
     logging.info("Proceso de Data Warehousing finalizado con éxito.")
 
 
@@ -1,3 +1,4 @@
+import functools
 import pandas as pd
 import sqlite3
 import logging
@@ -47,6 +48,7 @@ TABLE_MAPPING = {
 }
 
 
+@functools.lru_cache(maxsize=256)
 def normalize_column_name(col_name: str) -> str:
     """
     Convierte un nombre de columna a formato snake_case y limpia caracteres especiales.
@@ -169,11 +171,9 @@ def load_csv_to_table(conn: sqlite3.Connection, file_path: Path, table_name: str
                              f"Se encontraron {duplicates} filas duplicadas ({duplicate_percentage:.1f}%)", QualitySeverity.HIGH.value)
 
         # Normalizar los nombres de las columnas del DataFrame
-        original_columns = df.columns
-        df.columns = [normalize_column_name(col) for col in original_columns]
-        renamed_cols_map = {
-            orig: new for orig, new in zip(original_columns, df.columns) if orig != new
-        }
+        rename_map = {col: normalize_column_name(col) for col in df.columns}
+        renamed_cols_map = {orig: new for orig, new in rename_map.items() if orig != new}
+        df.rename(columns=rename_map, inplace=True)
         if renamed_cols_map:
             logging.info(f"Columnas renombradas: {renamed_cols_map}")
             # Registrar conteo de columnas renombradas
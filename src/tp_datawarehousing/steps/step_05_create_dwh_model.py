@@ -11,6 +11,34 @@ logging.basicConfig(
 DB_PATH = "db/tp_dwa.db"
 USER = "data_engineer"  # Para la metadata
 
+# Clave de cambio SCD2 de DWA_DIM_Clientes: atributos versionados concatenados
+# (separador char(31)). El Paso 9 la compara con la misma expresión sobre TMP2_customers.
+CLAVE_CAMBIO_CLIENTES_EXPR = """
+                COALESCE(direccion, '') || char(31) || COALESCE(ciudad, '') || char(31) ||
+                COALESCE(region, '') || char(31) || COALESCE(codigo_postal, '') || char(31) ||
+                COALESCE(pais, '') || char(31) || COALESCE(nombre_contacto, '') || char(31) ||
+                COALESCE(titulo_contacto, '')
+            """
+
+
+def add_clave_cambio_if_missing(cursor: sqlite3.Cursor):
+    """
+    Agrega la columna generada clave_cambio a una DWA_DIM_Clientes creada antes de
+    que existiera (CREATE TABLE IF NOT EXISTS no modifica una tabla existente).
+    SQLite no permite agregar con ALTER TABLE una columna STORED, por lo que en ese
+    caso se agrega como VIRTUAL: se calcula al leerla, con el mismo valor.
+    """
+    # table_xinfo (a diferencia de table_info) incluye las columnas generadas
+    columns = {row[1] for row in cursor.execute("PRAGMA table_xinfo(DWA_DIM_Clientes)")}
+    if "clave_cambio" in columns:
+        return
+    cursor.execute(
+        f"""
+        ALTER TABLE DWA_DIM_Clientes ADD COLUMN clave_cambio TEXT
+        GENERATED ALWAYS AS ({CLAVE_CAMBIO_CLIENTES_EXPR}) VIRTUAL"""
+    )
+    logging.info("Columna generada clave_cambio agregada a DWA_DIM_Clientes existente.")
+
 
 def create_dwh_tables():
     """
@@ -47,7 +75,7 @@ def create_dwh_tables():
         # sk: Surrogate Key
         # nk: Natural Key
         cursor.execute(
-            """
+            f"""
         CREATE TABLE IF NOT EXISTS DWA_DIM_Clientes (
             sk_cliente INTEGER PRIMARY KEY AUTOINCREMENT,
             nk_cliente_id TEXT NOT NULL,
@@ -62,9 +90,14 @@ def create_dwh_tables():
             -- Campos para SCD Tipo 2 (Capa de Memoria)
             fecha_inicio_validez DATE NOT NULL,
             fecha_fin_validez DATE,
-            es_vigente INTEGER NOT NULL -- 1 para vigente, 0 para histórico
+            es_vigente INTEGER NOT NULL, -- 1 para vigente, 0 para histórico
+            -- Clave de cambio SCD2: atributos versionados concatenados (separador char(31)).
+            -- Columna generada: SQLite la mantiene en cada INSERT/UPDATE, y la detección
+            -- de cambios compara un único valor en lugar de siete columnas.
+            clave_cambio TEXT GENERATED ALWAYS AS ({CLAVE_CAMBIO_CLIENTES_EXPR}) STORED
         )"""
         )
+        add_clave_cambio_if_missing(cursor)
 
         # --- Dimensión Productos ---
         cursor.execute(
@@ -166,6 +199,53 @@ def create_dwh_tables():
         )
         logging.info("Tabla de Hechos creada con éxito.")
 
+        # --- Índices de Soporte para las Cargas ---
+        # Permite que el LEFT JOIN de la carga de hechos con la versión vigente
+        # del cliente (nk_cliente_id = ? AND es_vigente = 1) sea un SEARCH por índice.
+        logging.info("Creando índices de soporte del DWH...")
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_dim_clientes_nk_vigente
+        ON DWA_DIM_Clientes (nk_cliente_id, es_vigente)"""
+        )
+        # Resolución de sk_geografia por (direccion, ciudad, pais) en las cargas de hechos;
+        # sin él SQLite construye un índice automático en cada sentencia
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_dim_geografia_direccion
+        ON DWA_DIM_Geografia (direccion, ciudad, pais, sk_geografia)"""
+        )
+        # Índice cubriente para los controles de lógica temporal SCD2
+        # (fecha_inicio_validez > fecha_fin_validez): se recorre el índice, no la tabla
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_dim_clientes_validez
+        ON DWA_DIM_Clientes (fecha_inicio_validez, fecha_fin_validez)"""
+        )
+        # Búsqueda de claves subrogadas por clave natural en las cargas de hechos;
+        # sin estos índices SQLite construye un índice automático en cada sentencia
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_dim_productos_nk
+        ON DWA_DIM_Productos (nk_producto_id, sk_producto)"""
+        )
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_dim_empleados_nk
+        ON DWA_DIM_Empleados (nk_empleado_id, sk_empleado)"""
+        )
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_dim_shippers_nk
+        ON DWA_DIM_Shippers (nk_shipper_id, sk_shipper)"""
+        )
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_dim_tiempo_fecha
+        ON DWA_DIM_Tiempo (fecha, sk_tiempo)"""
+        )
+        logging.info("Índices del DWH creados con éxito.")
+
         # --- Registrar en Metadata ---
         logging.info("Registrando nuevas tablas en Metadata (MET_)...")
         dwh_tables = {
@@ -1,6 +1,7 @@
 import sqlite3
 import logging
 from datetime import datetime
+from typing import Dict, Optional
 from tp_datawarehousing.utils.quality_utils import (
     get_process_execution_id,
     update_process_execution,
@@ -20,18 +21,58 @@ logging.basicConfig(
 # --- Constantes ---
 DB_PATH = "db/tp_dwa.db"
 USER = "data_engineer"
+# Los controles de calidad re-preparan muchas sentencias distintas (una por tabla);
+# ampliamos el cache para que el INSERT del DQM no sea desalojado entre llamadas.
+CACHED_STATEMENTS = 256
+
+# Índices de DWA_FACT_Ventas construidos después de la carga masiva de hechos: se
+# eliminan antes del INSERT ... SELECT y se crean una sola vez con la tabla completa,
+# en lugar de mantener cada B-tree fila por fila durante la carga
+FACT_POST_LOAD_INDEXES = {
+    # Localiza los hechos por (orden, producto) en las actualizaciones incrementales
+    "idx_fact_ventas_orden_producto": "DWA_FACT_Ventas (nk_orden_id, sk_producto)",
+    # Índices cubrientes de las agregaciones de los productos de datos (Paso 10):
+    # incluyen todas las columnas de hechos que lee cada consulta, de modo que se
+    # recorre el índice en lugar de la tabla
+    "idx_fact_ventas_dp1": "DWA_FACT_Ventas (sk_tiempo, sk_producto, sk_geografia_envio, monto_total)",
+    "idx_fact_ventas_dp2": (
+        "DWA_FACT_Ventas (sk_tiempo, sk_empleado, nk_orden_id, monto_total, sk_producto, sk_cliente)"
+    ),
+    "idx_fact_ventas_dp3": (
+        "DWA_FACT_Ventas (sk_tiempo, sk_shipper, sk_geografia_envio, flete, nk_orden_id, cantidad, monto_total)"
+    ),
+}
+
+# SQL constante: el texto idéntico permite reutilizar la sentencia preparada
+DQ_METRIC_INSERT_SQL = """
+    INSERT INTO DQM_descriptivos_entidad (id_ejecucion, nombre_entidad, nombre_metrica, valor_metrica)
+    VALUES (?, ?, ?, ?)
+"""
 
 
 # --- Funciones de Compatibilidad (mantenidas para no romper código existente) ---
 def log_dq_metric(conn, process_id, table_name, metric_name, metric_value):
     """Registra una métrica descriptiva de una entidad en el DQM."""
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO DQM_descriptivos_entidad (id_ejecucion, nombre_entidad, nombre_metrica, valor_metrica)
-        VALUES (?, ?, ?, ?)
-        """,
-        (process_id, table_name, metric_name, metric_value),
+    conn.execute(
+        DQ_METRIC_INSERT_SQL, (process_id, table_name, metric_name, metric_value)
+    )
+    conn.commit()
+
+
+def log_dq_metrics(conn, process_id, metrics):
+    """
+    Registra en lote varias métricas descriptivas en una única transacción.
+
+    Args:
+        conn: Conexión a la base de datos
+        process_id: ID de ejecución
+        metrics: Lista de tuplas (nombre_entidad, nombre_metrica, valor_metrica)
+    """
+    if not metrics:
+        return
+    conn.executemany(
+        DQ_METRIC_INSERT_SQL,
+        [(process_id, table, name, value) for table, name, value in metrics],
     )
     conn.commit()
 
@@ -58,12 +99,15 @@ def perform_ingestion_quality_checks(conn, process_id):
     }
 
     overall_status = "OK"
+    # Los conteos se acumulan y se insertan juntos al final: log_dq_check escribe
+    # por otra conexión, por lo que no podemos mantener abierta esta transacción.
+    row_count_metrics = []
 
     for table, pk_column in tables_to_check.items():
         # Conteo de Filas
         cursor.execute(f"SELECT COUNT(*) FROM {table}")
         row_count = cursor.fetchone()[0]
-        log_dq_metric(conn, process_id, table, "conteo_filas", row_count)
+        row_count_metrics.append((table, "conteo_filas", row_count))
 
         # Chequeo de Nulos en PK
         cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {pk_column} IS NULL")
@@ -97,6 +141,8 @@ def perform_ingestion_quality_checks(conn, process_id):
         f"Se encontraron {negative_values_count} registros con precios o cantidades negativas.",
     )
 
+    log_dq_metrics(conn, process_id, row_count_metrics)
+
     logging.info(
         f"--- Controles de Calidad de Ingesta Finalizados. Estado General: {overall_status} ---"
     )
@@ -145,8 +191,14 @@ def perform_integration_quality_checks(conn, process_id):
     cursor.execute(f"SELECT COUNT(*) FROM {fact_table}")
     dwh_count = cursor.fetchone()[0]
 
-    log_dq_metric(conn, process_id, "ING_order_details", "conteo_filas", ing_count)
-    log_dq_metric(conn, process_id, fact_table, "conteo_filas", dwh_count)
+    log_dq_metrics(
+        conn,
+        process_id,
+        [
+            ("ING_order_details", "conteo_filas", ing_count),
+            (fact_table, "conteo_filas", dwh_count),
+        ],
+    )
 
     status = "OK" if ing_count == dwh_count else "ADVERTENCIA"
     if status != "OK":
@@ -438,6 +490,8 @@ def load_fact_ventas(conn):
     """Carga la tabla de hechos de Ventas uniendo staging y dimensiones."""
     logging.info("Iniciando la carga de DWA_FACT_Ventas...")
     cursor = conn.cursor()
+    for index_name in FACT_POST_LOAD_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
     cursor.execute("DELETE FROM DWA_FACT_Ventas;")
 
     cursor.execute(
@@ -469,6 +523,8 @@ def load_fact_ventas(conn):
     """
     )
     count = cursor.rowcount
+    for index_name, index_target in FACT_POST_LOAD_INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {index_target}")
     conn.commit()
     logging.info(f"Carga de DWA_FACT_Ventas completada. {count} registros insertados.")
     return count
@@ -489,7 +545,7 @@ def main():
 
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(DB_PATH, cached_statements=CACHED_STATEMENTS)
         log_quality_metric(
             execution_id,
             "DATABASE_CONNECTION",
@@ -524,19 +580,21 @@ def main():
         # 2. Cargar el DWH (Dimensiones y Hechos)
         logging.info("--- Iniciando Carga de Dimensiones ---")
         dimensions_loaded = 0
+        # Conteos devueltos por los loaders, reutilizados en la validación final
+        table_counts = {}
 
         try:
-            load_dim_shippers(conn)
+            table_counts["DWA_DIM_Shippers"] = load_dim_shippers(conn)
             dimensions_loaded += 1
-            load_dim_tiempo(conn)
+            table_counts["DWA_DIM_Tiempo"] = load_dim_tiempo(conn)
             dimensions_loaded += 1
-            load_dim_productos(conn)
+            table_counts["DWA_DIM_Productos"] = load_dim_productos(conn)
             dimensions_loaded += 1
-            load_dim_empleados(conn)
+            table_counts["DWA_DIM_Empleados"] = load_dim_empleados(conn)
             dimensions_loaded += 1
-            load_dim_clientes(conn)
+            table_counts["DWA_DIM_Clientes"] = load_dim_clientes(conn)
             dimensions_loaded += 1
-            load_dim_geografia(conn)
+            table_counts["DWA_DIM_Geografia"] = load_dim_geografia(conn)
             dimensions_loaded += 1
 
             log_quality_metric(
@@ -562,6 +620,7 @@ def main():
         logging.info("--- Iniciando Carga de la Tabla de Hechos ---")
         try:
             ventas_count = load_fact_ventas(conn)
+            table_counts["DWA_FACT_Ventas"] = ventas_count
             log_record_count(execution_id, "LOADED", "DWA_FACT_Ventas", ventas_count)
             log_quality_metric(
                 execution_id,
@@ -601,7 +660,7 @@ def main():
             final_status = "FALLIDO"
 
         # Validaciones adicionales del DWH completo
-        validate_dwh_completeness(execution_id, conn)
+        validate_dwh_completeness(execution_id, conn, table_counts)
 
         # Finalizar proceso
         comments = (
@@ -634,9 +693,30 @@ def main():
             logging.info("Conexión a la base de datos cerrada.")
 
 
-def validate_dwh_completeness(execution_id: int, conn: sqlite3.Connection):
+def _get_table_count(cursor, table_name, table_counts):
+    """
+    Devuelve el conteo de una tabla usando el valor ya conocido por los loaders.
+    Solo recurre a SELECT COUNT(*) si el conteo no fue informado.
+    """
+    if table_counts is not None and table_name in table_counts:
+        return table_counts[table_name]
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    return cursor.fetchone()[0]
+
+
+def validate_dwh_completeness(
+    execution_id: int,
+    conn: sqlite3.Connection,
+    table_counts: Optional[Dict[str, int]] = None,
+):
     """
     Valida que el DWH esté completo después de la carga inicial.
+
+    Args:
+        execution_id: ID de ejecución
+        conn: Conexión a la base de datos
+        table_counts: Conteos por tabla devueltos por los loaders (opcional).
+            Evita un escaneo completo por tabla; las tablas ausentes se cuentan.
     """
     cursor = conn.cursor()
     fact_count = 0  # Inicializar la variable
@@ -656,8 +736,7 @@ def validate_dwh_completeness(execution_id: int, conn: sqlite3.Connection):
 
     for dim in dimensions:
         try:
-            cursor.execute(f"SELECT COUNT(*) FROM {dim}")
-            count = cursor.fetchone()[0]
+            count = _get_table_count(cursor, dim, table_counts)
             total_dim_records += count
 
             if count == 0:
@@ -698,8 +777,7 @@ def validate_dwh_completeness(execution_id: int, conn: sqlite3.Connection):
 
     # Verificar tabla de hechos
     try:
-        cursor.execute("SELECT COUNT(*) FROM DWA_FACT_Ventas")
-        fact_count = cursor.fetchone()[0]
+        fact_count = _get_table_count(cursor, "DWA_FACT_Ventas", table_counts)
 
         if fact_count == 0:
             log_quality_metric(
@@ -1,9 +1,15 @@
+import functools
+import itertools
 import pandas as pd
 import sqlite3
 import logging
+import queue
 import re
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 from tp_datawarehousing.utils.quality_utils import (
     get_process_execution_id, 
     update_process_execution,
@@ -12,7 +18,8 @@ from tp_datawarehousing.utils.quality_utils import (
     validate_completeness_score,
     validate_business_key_uniqueness,
     QualityResult,
-    QualitySeverity
+    QualitySeverity,
+    QualityThresholds
 )
 
 # --- Configuración de Logging ---
@@ -24,6 +31,25 @@ logging.basicConfig(
 DB_PATH = "db/tp_dwa.db"
 INGESTA_PATH = ".data/ingesta2"
 
+# PRAGMAs de la conexión de carga masiva. Las tablas TMP2_ son efímeras, por lo
+# que se prioriza la velocidad de escritura sobre la durabilidad ante cortes.
+# No se cambia journal_mode ni locking_mode: la base está en WAL y las métricas
+# de calidad se registran desde otras conexiones concurrentes.
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -200000",  # ~200MB de cache de páginas
+    # Las validaciones posteriores escanean las tablas varias veces: leer el
+    # archivo mapeado en memoria evita copiar cada página al cache de SQLite.
+    # page_size no se ajusta: la base ya existe y está en WAL, donde no se puede cambiar.
+    "PRAGMA mmap_size = 268435456",  # 256MB
+)
+
+# INSERT multi-fila: filas por sentencia, acotadas por el máximo de parámetros
+# de SQLite (SQLITE_MAX_VARIABLE_NUMBER, 32766 desde 3.32)
+MULTI_ROW_INSERT_ROWS = 500
+SQLITE_MAX_VARIABLES = 32766
+
 # Mapeo de archivos CSV de Ingesta2 a nombres de tablas temporales TMP2_
 TABLE_MAPPING = {
     "customers - novedades.csv": "TMP2_customers",
@@ -33,10 +59,12 @@ TABLE_MAPPING = {
 
 # Definición del esquema para las nuevas tablas TMP2.
 # Deben ser compatibles con las tablas de la capa de Ingesta (ING_).
+# Las tablas se crean sin PRIMARY KEY para no mantener el índice fila a fila
+# durante la carga; las claves se indexan al final (ver TABLE_POST_INDEXES).
 TABLE_SCHEMAS = {
     "TMP2_customers": """
         CREATE TABLE IF NOT EXISTS TMP2_customers (
-            customer_id TEXT PRIMARY KEY,
+            customer_id TEXT,
             company_name TEXT,
             contact_name TEXT,
             contact_title TEXT,
@@ -51,7 +79,7 @@ TABLE_SCHEMAS = {
     """,
     "TMP2_orders": """
         CREATE TABLE IF NOT EXISTS TMP2_orders (
-            order_id INTEGER PRIMARY KEY,
+            order_id INTEGER,
             customer_id TEXT,
             employee_id INTEGER,
             order_date TEXT,
@@ -78,78 +106,317 @@ TABLE_SCHEMAS = {
     """,
 }
 
+# Script de preparación: recrea todas las tablas TMP2_ en un único lote
+TABLE_SETUP_SQL = "\n".join(
+    f"DROP TABLE IF EXISTS {table};\n{schema.strip()}"
+    for table, schema in TABLE_SCHEMAS.items()
+)
+
+# Claves de negocio de cada tabla TMP2_, validadas tras la carga
+BUSINESS_KEYS = {
+    "TMP2_customers": ["customer_id"],
+    "TMP2_orders": ["order_id"],
+    "TMP2_order_details": ["order_id", "product_id"],
+}
+
+# Filas por bloque al leer los CSV de Ingesta2
+CSV_CHUNK_SIZE = 50_000
+
+# Bloques parseados por archivo que pueden esperar en memoria a ser insertados
+CSV_PREFETCH_CHUNKS = 2
+
+# Tipos de pandas equivalentes a las afinidades SQLite usadas en TABLE_SCHEMAS
+SQL_TO_PANDAS_DTYPE = {
+    "TEXT": "string",
+    "INTEGER": "Int64",
+    "REAL": "float64",
+}
+
+
+def schema_dtypes(schema_sql: str) -> dict:
+    """
+    Deriva el mapeo {columna: dtype de pandas} a partir de un CREATE TABLE.
+    """
+    return {
+        column: SQL_TO_PANDAS_DTYPE[sql_type]
+        for column, sql_type in re.findall(
+            r"^\s*(\w+)\s+(TEXT|INTEGER|REAL)\b", schema_sql, flags=re.MULTILINE
+        )
+    }
+
+
+# Tipos por tabla: evita la inferencia de tipos de read_csv y preserva
+# valores como códigos postales con ceros a la izquierda
+TABLE_DTYPES = {table: schema_dtypes(schema) for table, schema in TABLE_SCHEMAS.items()}
+
+# Índices de clave (únicos donde reemplazan a las PRIMARY KEY), creados una vez cargados los datos
+TABLE_POST_INDEXES = {
+    "TMP2_customers": "CREATE UNIQUE INDEX IF NOT EXISTS idx_tmp2_customers_pk ON TMP2_customers (customer_id);",
+    "TMP2_orders": "CREATE UNIQUE INDEX IF NOT EXISTS idx_tmp2_orders_pk ON TMP2_orders (order_id);",
+    # No único: soporta el JOIN por (orden, producto) de la actualización de hechos
+    "TMP2_order_details": "CREATE INDEX IF NOT EXISTS idx_tmp2_order_details_order_prod ON TMP2_order_details (order_id, product_id);",
+}
+
+
+# Expresiones regulares de normalización de columnas, compiladas una sola vez.
+# Separadores y fronteras camelCase se resuelven en una única pasada.
+_RE_NORMALIZE = re.compile(r"([-\s\./:]+)|([a-z\d])([A-Z])")
+_RE_DUP = re.compile(r"__+")
+
 
+def _normalize_match(match: re.Match) -> str:
+    """Reemplazo para _RE_NORMALIZE: '_' para separadores, 'a_B' para camelCase."""
+    if match.group(1) is not None:
+        return "_"
+    return f"{match.group(2)}_{match.group(3)}"
+
+
+@functools.lru_cache(maxsize=512)
 def normalize_column_name(col_name: str) -> str:
     """
     Convierte un nombre de columna a formato snake_case y limpia caracteres especiales.
     E.g., 'Contact Name' -> 'contact_name', 'OrderID' -> 'order_id'
     """
-    name = re.sub(r"[-\s\./:]+", "_", col_name)
-    name = re.sub(r"([a-z\d])([A-Z])", r"\1_\2", name)
-    name = name.lower()
-    name = re.sub(r"__+", "_", name)
-    return name
+    name = _RE_NORMALIZE.sub(_normalize_match, col_name).lower()
+    return _RE_DUP.sub("_", name)
+
+
+def normalize_column_names(columns: pd.Index) -> pd.Index:
+    """
+    Versión vectorizada de normalize_column_name: aplica cada transformación
+    sobre el Index completo de columnas en lugar de nombre por nombre.
+    """
+    return (
+        columns.str.replace(_RE_NORMALIZE, _normalize_match, regex=True)
+        .str.lower()
+        .str.replace(_RE_DUP, "_", regex=True)
+    )
+
+
+def build_insert_sql(table_name: str, columns, rows_per_statement: int = 1) -> str:
+    """
+    Construye la sentencia INSERT parametrizada para las columnas indicadas, con
+    rows_per_statement filas en la cláusula VALUES.
+    """
+    row_placeholders = "(" + ", ".join(["?"] * len(columns)) + ")"
+    values = ", ".join([row_placeholders] * rows_per_statement)
+    return f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES {values}"
+
+
+def insert_dataframe(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame, commit: bool = True, insert_sql: Optional[str] = None) -> int:
+    """
+    Inserta un DataFrame en una tabla existente con INSERT multi-fila: bloques de
+    hasta MULTI_ROW_INSERT_ROWS filas por sentencia y el resto fila a fila, cada
+    grupo con un único executemany. Evita la maquinaria genérica de df.to_sql.
+    Con commit=False la inserción queda dentro de la transacción en curso (útil para
+    cargar un archivo por bloques).
+    Si se recibe insert_sql (de una fila, ya construido para las columnas del
+    DataFrame) se reutiliza para el resto.
+
+    Returns:
+        Número de registros insertados
+    """
+    if insert_sql is None:
+        insert_sql = build_insert_sql(table_name, df.columns)
+
+    # Convertir a objetos Python nativos y NaN -> None para que SQLite guarde NULL
+    rows = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+    rows_per_statement = max(1, min(MULTI_ROW_INSERT_ROWS, SQLITE_MAX_VARIABLES // max(1, len(df.columns))))
+    full_rows = len(rows) - len(rows) % rows_per_statement
+    if full_rows and rows_per_statement > 1:
+        multi_row_sql = build_insert_sql(table_name, df.columns, rows_per_statement)
+        conn.executemany(
+            multi_row_sql,
+            (
+                tuple(itertools.chain.from_iterable(rows[start:start + rows_per_statement]))
+                for start in range(0, full_rows, rows_per_statement)
+            ),
+        )
+    else:
+        full_rows = 0
+    if full_rows < len(rows):
+        conn.executemany(insert_sql, rows[full_rows:])
+    if commit:
+        conn.commit()
+    return len(df)
+
+
+def _put_unless_cancelled(chunk_queue: queue.Queue, item, cancelled: threading.Event) -> bool:
+    """Encola un elemento esperando lugar, salvo que el consumidor haya cancelado."""
+    while not cancelled.is_set():
+        try:
+            chunk_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def produce_csv_chunks(file_path: Path, dtype: dict, chunk_queue: queue.Queue, cancelled: threading.Event):
+    """
+    Productor en segundo plano: parsea un CSV por bloques y los encola.
+    Al terminar encola None, o la excepción si el parseo falla. La cola acotada
+    mantiene el límite de memoria de la lectura por bloques.
+    """
+    try:
+        for chunk in pd.read_csv(file_path, dtype=dtype, engine="c", chunksize=CSV_CHUNK_SIZE):
+            if not _put_unless_cancelled(chunk_queue, chunk, cancelled):
+                return
+        end_marker = None
+    except Exception as e:
+        end_marker = e
+    _put_unless_cancelled(chunk_queue, end_marker, cancelled)
+
+
+def consume_csv_chunks(chunk_queue: queue.Queue):
+    """Itera los bloques encolados por produce_csv_chunks, propagando sus errores."""
+    while True:
+        item = chunk_queue.get()
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def create_post_load_indexes(conn: sqlite3.Connection, execution_id: int):
+    """
+    Crea los índices de clave de las tablas TMP2_ después de la carga masiva.
+    Si hay claves duplicadas el índice único no puede crearse: se registra la
+    violación y se crea un índice no único para no penalizar los JOINs posteriores.
+    """
+    for table_name, index_sql in TABLE_POST_INDEXES.items():
+        try:
+            conn.execute(index_sql)
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            logging.warning(f"No se pudo crear el índice único de {table_name}: {e}")
+            log_quality_metric(
+                execution_id,
+                "PRIMARY_KEY_INDEX",
+                table_name,
+                QualityResult.FAIL.value,
+                f"Claves duplicadas, índice único no creado: {str(e)}",
+                QualitySeverity.HIGH.value,
+            )
+            conn.execute(index_sql.replace("UNIQUE INDEX", "INDEX"))
+            conn.commit()
 
 
 def create_and_load_staging_tables(conn: sqlite3.Connection, execution_id: int):
     """
     Crea las tablas TMP2_ y carga los datos de los CSV de Ingesta2.
     """
-    cursor = conn.cursor()
     logging.info("Creando tablas de Staging para Ingesta2 (TMP2_)...")
-    for table, schema in TABLE_SCHEMAS.items():
-        cursor.execute(f"DROP TABLE IF EXISTS {table};")  # Asegurar carga limpia
-        cursor.execute(schema)
-    conn.commit()
+    # DROP (asegurar carga limpia) + CREATE de todas las tablas en un único lote
+    conn.executescript(TABLE_SETUP_SQL)
     logging.info("Tablas TMP2_ creadas/limpiadas con éxito.")
 
     ingesta_dir = Path(INGESTA_PATH)
-    for csv_file, table_name in TABLE_MAPPING.items():
-        file_path = ingesta_dir / csv_file
-        if not file_path.exists():
-            logging.warning(
-                f"El archivo {csv_file} no se encontró en {INGESTA_PATH}. Se omite."
-            )
-            continue
-
+    loaded_tables = []
+    with ThreadPoolExecutor(max_workers=len(TABLE_MAPPING)) as executor:
+        pending_files = []
         try:
-            logging.info(f"Procesando archivo: {file_path.name} -> Tabla: {table_name}")
-            df = pd.read_csv(file_path)
-
-            original_columns = df.columns
-            df.columns = [normalize_column_name(col) for col in original_columns]
-            renamed_cols_map = {
-                orig: new
-                for orig, new in zip(original_columns, df.columns)
-                if orig != new
-            }
-            if renamed_cols_map:
-                logging.info(f"Columnas renombradas: {renamed_cols_map}")
-                # Registrar conteo de columnas renombradas
-                log_quality_metric(execution_id, "COLUMN_NORMALIZATION", file_path.name, "PERFORMED", 
-                                 f"Columnas renombradas: {len(renamed_cols_map)}")
-                # Registrar mapeo detallado para trazabilidad completa
-                log_quality_metric(execution_id, "COLUMN_NORMALIZATION_DETAIL", file_path.name, "MAPPING", 
-                                 json.dumps(renamed_cols_map, ensure_ascii=False))
-
-            df.to_sql(table_name, conn, if_exists="append", index=False)
-            logging.info(
-                f"Carga exitosa de {len(df)} registros en la tabla {table_name}."
-            )
-            
-            # AGREGAR VALIDACIONES DE CALIDAD ESPECÍFICAS
-            perform_data_quality_validations(execution_id, table_name, file_path.name, conn)
-            
-        except Exception as e:
-            logging.error(
-                f"Error al cargar el archivo {file_path.name} a la tabla {table_name}: {e}"
-            )
+            # Fase 1: preparar cada archivo y lanzar su parseo en segundo plano.
+            # Los tres CSV se parsean en paralelo (el parser C de pandas libera el GIL).
+            for csv_file, table_name in TABLE_MAPPING.items():
+                file_path = ingesta_dir / csv_file
+                if not file_path.exists():
+                    logging.warning(
+                        f"El archivo {csv_file} no se encontró en {INGESTA_PATH}. Se omite."
+                    )
+                    continue
+
+                try:
+                    logging.info(f"Procesando archivo: {file_path.name} -> Tabla: {table_name}")
+                    # Los dtypes se expresan sobre los encabezados originales del CSV
+                    original_columns = pd.read_csv(file_path, nrows=0).columns
+                    normalized_columns = normalize_column_names(original_columns)
+                    table_dtypes = TABLE_DTYPES[table_name]
+                    # dtypes y mapeo de renombrado en una sola pasada por los encabezados
+                    dtype = {}
+                    renamed_cols_map = {}
+                    for orig, new in zip(original_columns, normalized_columns):
+                        if new in table_dtypes:
+                            dtype[orig] = table_dtypes[new]
+                        if orig != new:
+                            renamed_cols_map[orig] = new
+                    if renamed_cols_map:
+                        logging.info(f"Columnas renombradas: {renamed_cols_map}")
+                        # Registrar conteo de columnas renombradas
+                        log_quality_metric(execution_id, "COLUMN_NORMALIZATION", file_path.name, "PERFORMED", 
+                                         f"Columnas renombradas: {len(renamed_cols_map)}")
+                        # Registrar mapeo detallado para trazabilidad completa
+                        log_quality_metric(execution_id, "COLUMN_NORMALIZATION_DETAIL", file_path.name, "MAPPING", 
+                                         json.dumps(renamed_cols_map, ensure_ascii=False))
+
+                    chunk_queue = queue.Queue(maxsize=CSV_PREFETCH_CHUNKS)
+                    cancelled = threading.Event()
+                    # La sentencia INSERT se arma una vez por archivo, no por bloque
+                    insert_sql = build_insert_sql(table_name, normalized_columns)
+                    # Registrar el archivo antes de lanzar su productor: el finally debe
+                    # poder cancelar todo productor en marcha
+                    pending_files.append(
+                        (table_name, file_path, normalized_columns, insert_sql, chunk_queue, cancelled)
+                    )
+                    executor.submit(produce_csv_chunks, file_path, dtype, chunk_queue, cancelled)
+
+                except Exception as e:
+                    logging.error(
+                        f"Error al cargar el archivo {file_path.name} a la tabla {table_name}: {e}"
+                    )
+
+            # Fase 2: insertar en orden desde el hilo principal (la conexión SQLite no
+            # se comparte entre hilos). Cada archivo se confirma en una única transacción.
+            for table_name, file_path, normalized_columns, insert_sql, chunk_queue, cancelled in pending_files:
+                try:
+                    records_loaded = 0
+                    chunk_count = 0
+                    df = None
+                    for chunk in consume_csv_chunks(chunk_queue):
+                        chunk.columns = normalized_columns
+                        records_loaded += insert_dataframe(
+                            conn, table_name, chunk, commit=False, insert_sql=insert_sql
+                        )
+                        chunk_count += 1
+                        # El DataFrame solo se conserva para validar en memoria si el archivo
+                        # entra en un único bloque; si no, las validaciones consultan la tabla.
+                        df = chunk if chunk_count == 1 else None
+                    conn.commit()
+                    logging.info(
+                        f"Carga exitosa de {records_loaded} registros en la tabla {table_name}."
+                    )
+                    loaded_tables.append((table_name, file_path.name, df))
 
+                except Exception as e:
+                    cancelled.set()  # Liberar al productor si quedó esperando lugar en la cola
+                    conn.rollback()
+                    logging.error(
+                        f"Error al cargar el archivo {file_path.name} a la tabla {table_name}: {e}"
+                    )
+        finally:
+            # Ante cualquier salida (error, KeyboardInterrupt) liberar a los productores
+            # que aún esperan lugar en su cola; si no, el cierre del executor los
+            # esperaría indefinidamente
+            for *_, cancelled in pending_files:
+                cancelled.set()
 
-def perform_data_quality_validations(execution_id: int, table_name: str, file_name: str, conn: sqlite3.Connection):
+    # Índices de clave construidos una sola vez, con todas las tablas ya cargadas
+    create_post_load_indexes(conn, execution_id)
+
+    # AGREGAR VALIDACIONES DE CALIDAD ESPECÍFICAS
+    for table_name, file_name, df in loaded_tables:
+        perform_data_quality_validations(execution_id, table_name, file_name, conn, df)
+
+
+def perform_data_quality_validations(execution_id: int, table_name: str, file_name: str, conn: sqlite3.Connection, df: Optional[pd.DataFrame] = None):
     """
     Realiza validaciones específicas de calidad de datos para cada tabla de Ingesta2.
     Detecta los problemas específicos que mencionaste.
+    Si se recibe el DataFrame recién cargado, las validaciones que lo admiten
+    se calculan en memoria en lugar de escanear la tabla.
     """
     cursor = conn.cursor()
     
@@ -167,15 +434,10 @@ def perform_data_quality_validations(execution_id: int, table_name: str, file_na
         )
         
         # Validar unicidad de customer_id
-        validate_business_key_uniqueness(
-            execution_id,
-            table_name,
-            ["customer_id"],
-            conn
-        )
+        validate_keys_uniqueness(execution_id, table_name, conn, df)
         
         # Validación específica para region (problema detectado)
-        validate_null_percentage(execution_id, table_name, "region", file_name, conn)
+        validate_null_percentage(execution_id, table_name, "region", file_name, conn, df)
         
     elif table_name == "TMP2_orders":
         # Validar completitud de campos críticos para orders
@@ -187,18 +449,18 @@ def perform_data_quality_validations(execution_id: int, table_name: str, file_na
         )
         
         # Validar unicidad de order_id
-        validate_business_key_uniqueness(
+        validate_keys_uniqueness(execution_id, table_name, conn, df)
+        
+        # Validaciones específicas para problemas detectados
+        validate_null_percentages(
             execution_id,
             table_name,
-            ["order_id"],
-            conn
+            ["shipped_date", "ship_region", "ship_postal_code"],
+            file_name,
+            conn,
+            df
         )
         
-        # Validaciones específicas para problemas detectados
-        validate_null_percentage(execution_id, table_name, "shipped_date", file_name, conn)
-        validate_null_percentage(execution_id, table_name, "ship_region", file_name, conn)
-        validate_null_percentage(execution_id, table_name, "ship_postal_code", file_name, conn)
-        
         # Validar lógica de negocio: shipped_date >= order_date
         validate_shipping_logic(execution_id, table_name, conn)
         
@@ -212,92 +474,200 @@ def perform_data_quality_validations(execution_id: int, table_name: str, file_na
         )
         
         # Validar unicidad de la clave compuesta
-        validate_business_key_uniqueness(
-            execution_id,
-            table_name,
-            ["order_id", "product_id"],
-            conn
-        )
+        validate_keys_uniqueness(execution_id, table_name, conn, df)
         
         # Validar rangos de valores para campos numéricos
         validate_numeric_ranges(execution_id, table_name, conn)
 
 
-def validate_null_percentage(execution_id: int, table_name: str, column_name: str, file_name: str, conn: sqlite3.Connection):
+def validate_keys_uniqueness(execution_id: int, table_name: str, conn: sqlite3.Connection, df: Optional[pd.DataFrame] = None) -> bool:
     """
-    Calcula y reporta el porcentaje de valores nulos en una columna específica.
+    Valida la unicidad de la clave de negocio de la tabla (ver BUSINESS_KEYS).
+    Con el DataFrame cargado se resuelve en memoria con un hash de pandas en lugar
+    del GROUP BY en SQLite; sin él, delega en validate_business_key_uniqueness.
     """
-    cursor = conn.cursor()
-    
-    try:
-        # Contar total de registros
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        total_records = cursor.fetchone()[0]
-        
-        # Contar valores nulos
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE {column_name} IS NULL OR TRIM({column_name}) = ''")
-        null_count = cursor.fetchone()[0]
-        
-        if total_records == 0:
-            percentage = 0
-        else:
-            percentage = (null_count / total_records) * 100
-        
-        # Determinar resultado basado en umbrales
-        if percentage == 0:
-            result = QualityResult.PASS.value
-            severity = QualitySeverity.LOW.value
-        elif percentage < 10:
+    business_keys = BUSINESS_KEYS[table_name]
+    if df is None or not all(key in df.columns for key in business_keys):
+        return validate_business_key_uniqueness(execution_id, table_name, business_keys, conn)
+
+    keyed = df.dropna(subset=business_keys)
+    total_valid_records = len(keyed)
+    duplicated = keyed.duplicated(subset=business_keys, keep=False)
+
+    if not duplicated.any():
+        result = QualityResult.PASS.value
+        severity = QualitySeverity.LOW.value
+        detalles = f"Todas las claves de negocio son únicas ({total_valid_records} registros validados)"
+    else:
+        duplicates = (
+            keyed[duplicated]
+            .groupby(business_keys)
+            .size()
+            .sort_values(ascending=False, kind="stable")
+        )
+        total_duplicate_records = int(duplicates.sum())
+        duplicate_percentage = (total_duplicate_records / total_valid_records) * 100
+
+        if duplicate_percentage < QualityThresholds.DUPLICATES_WARNING:
             result = QualityResult.WARNING.value
             severity = QualitySeverity.MEDIUM.value
         else:
             result = QualityResult.FAIL.value
             severity = QualitySeverity.HIGH.value
-        
-        detalles = f"Valores nulos/vacíos: {null_count}/{total_records} ({percentage:.1f}%)"
-        
+
+        # Mostrar algunos ejemplos de duplicados (mismo formato que la versión SQL)
+        examples = []
+        for key_values, count in duplicates.head(3).items():
+            if not isinstance(key_values, tuple):
+                key_values = (key_values,)
+            key_str = ", ".join([str(v) for v in key_values])
+            examples.append(f"({key_str}): {count} veces")
+
+        examples_str = "; ".join(examples)
+        detalles = f"Duplicados encontrados: {len(duplicates)} claves, {total_duplicate_records} registros ({duplicate_percentage:.1f}%). Ejemplos: {examples_str}"
+
+    log_quality_metric(
+        execution_id,
+        "BUSINESS_KEY_UNIQUENESS",
+        table_name,
+        result,
+        detalles,
+        severity
+    )
+    return not duplicated.any()
+
+
+def count_null_or_blank(df: pd.DataFrame, column_name: str) -> int:
+    """
+    Cuenta valores nulos o vacíos en una columna del DataFrame.
+    Equivale a `col IS NULL OR TRIM(col) = ''` en SQLite (TRIM solo quita espacios).
+    """
+    column = df[column_name]
+    blank = column.astype("string").str.strip(" ") == ""
+    return int(column.isna().sum() + blank.fillna(False).sum())
+
+
+def fetch_null_counts(conn: sqlite3.Connection, table_name: str, column_names: list) -> tuple:
+    """
+    Cuenta nulos/vacíos de varias columnas con un único escaneo de la tabla.
+
+    Returns:
+        Tupla (total_registros, {columna: cantidad_nulos_o_vacios})
+    """
+    null_sums = ", ".join(
+        f"SUM(CASE WHEN {col} IS NULL OR TRIM({col}) = '' THEN 1 ELSE 0 END)"
+        for col in column_names
+    )
+    row = conn.execute(f"SELECT COUNT(*), {null_sums} FROM {table_name}").fetchone()
+    # SUM sobre una tabla vacía devuelve NULL
+    return row[0], {col: count or 0 for col, count in zip(column_names, row[1:])}
+
+
+def validate_null_percentages(execution_id: int, table_name: str, column_names: list, file_name: str, conn: sqlite3.Connection, df: Optional[pd.DataFrame] = None):
+    """
+    Calcula y reporta el porcentaje de valores nulos de varias columnas de una tabla.
+    Usa el DataFrame cargado si está disponible; si no, consulta la tabla una sola vez.
+    """
+    try:
+        if df is not None and df.empty:
+            # Tabla vacía: no hay nada que contar
+            total_records = 0
+            null_counts = dict.fromkeys(column_names, 0)
+        elif df is not None and all(col in df.columns for col in column_names):
+            total_records = len(df)
+            null_counts = {col: count_null_or_blank(df, col) for col in column_names}
+        else:
+            total_records, null_counts = fetch_null_counts(conn, table_name, column_names)
+    except sqlite3.Error as e:
+        for column_name in column_names:
+            log_quality_metric(
+                execution_id,
+                "NULL_PERCENTAGE_ERROR",
+                f"{table_name}.{column_name}",
+                QualityResult.ERROR.value,
+                f"Error calculando porcentaje de nulos: {str(e)}",
+                QualitySeverity.HIGH.value
+            )
+        return
+
+    for column_name in column_names:
+        report_null_percentage(
+            execution_id, table_name, column_name, file_name,
+            null_counts[column_name], total_records
+        )
+
+
+def validate_null_percentage(execution_id: int, table_name: str, column_name: str, file_name: str, conn: sqlite3.Connection, df: Optional[pd.DataFrame] = None):
+    """
+    Calcula y reporta el porcentaje de valores nulos en una columna específica.
+    Usa el DataFrame cargado si está disponible; si no, consulta la tabla.
+    """
+    validate_null_percentages(execution_id, table_name, [column_name], file_name, conn, df)
+
+
+def report_null_percentage(execution_id: int, table_name: str, column_name: str, file_name: str, null_count: int, total_records: int):
+    """
+    Registra en el DQM el porcentaje de nulos de una columna ya contada.
+    """
+    if total_records == 0:
+        # Sin registros no hay nulos ni problemas de negocio que reportar
         log_quality_metric(
             execution_id,
             "NULL_PERCENTAGE",
             f"{table_name}.{column_name}",
-            result,
-            detalles,
-            severity
+            QualityResult.PASS.value,
+            "Valores nulos/vacíos: 0/0 (0.0%)",
+            QualitySeverity.LOW.value
         )
-        
-        # Log específico del problema detectado
-        if column_name == "region" and table_name == "TMP2_customers" and percentage > 0:
-            log_quality_metric(
-                execution_id,
-                "BUSINESS_ISSUE_DETECTED",
-                f"{file_name}.{column_name}",
-                "CRITICAL",
-                f"🔴 PROBLEMA DETECTADO: {null_count} clientes sin región en archivo con solo {total_records} registros",
-                QualitySeverity.CRITICAL.value
-            )
-        elif column_name in ["shipped_date", "ship_region", "ship_postal_code"] and table_name == "TMP2_orders":
-            expected_reason = {
-                "shipped_date": "órdenes aún no despachadas",
-                "ship_region": "regiones no aplicables", 
-                "ship_postal_code": "códigos postales omitidos"
-            }
-            log_quality_metric(
-                execution_id,
-                "BUSINESS_ISSUE_DETECTED", 
-                f"{file_name}.{column_name}",
-                "WARNING" if percentage < 50 else "CRITICAL",
-                f"🟡 REVISAR: {null_count} valores faltantes en {column_name} - posiblemente {expected_reason[column_name]}",
-                QualitySeverity.MEDIUM.value if percentage < 50 else QualitySeverity.HIGH.value
-            )
+        return
+
+    percentage = (null_count / total_records) * 100
     
-    except sqlite3.Error as e:
+    # Determinar resultado basado en umbrales
+    if percentage == 0:
+        result = QualityResult.PASS.value
+        severity = QualitySeverity.LOW.value
+    elif percentage < 10:
+        result = QualityResult.WARNING.value
+        severity = QualitySeverity.MEDIUM.value
+    else:
+        result = QualityResult.FAIL.value
+        severity = QualitySeverity.HIGH.value
+    
+    detalles = f"Valores nulos/vacíos: {null_count}/{total_records} ({percentage:.1f}%)"
+    
+    log_quality_metric(
+        execution_id,
+        "NULL_PERCENTAGE",
+        f"{table_name}.{column_name}",
+        result,
+        detalles,
+        severity
+    )
+    
+    # Log específico del problema detectado
+    if column_name == "region" and table_name == "TMP2_customers" and percentage > 0:
         log_quality_metric(
             execution_id,
-            "NULL_PERCENTAGE_ERROR",
-            f"{table_name}.{column_name}",
-            QualityResult.ERROR.value,
-            f"Error calculando porcentaje de nulos: {str(e)}",
-            QualitySeverity.HIGH.value
+            "BUSINESS_ISSUE_DETECTED",
+            f"{file_name}.{column_name}",
+            "CRITICAL",
+            f"🔴 PROBLEMA DETECTADO: {null_count} clientes sin región en archivo con solo {total_records} registros",
+            QualitySeverity.CRITICAL.value
+        )
+    elif column_name in ["shipped_date", "ship_region", "ship_postal_code"] and table_name == "TMP2_orders":
+        expected_reason = {
+            "shipped_date": "órdenes aún no despachadas",
+            "ship_region": "regiones no aplicables", 
+            "ship_postal_code": "códigos postales omitidos"
+        }
+        log_quality_metric(
+            execution_id,
+            "BUSINESS_ISSUE_DETECTED", 
+            f"{file_name}.{column_name}",
+            "WARNING" if percentage < 50 else "CRITICAL",
+            f"🟡 REVISAR: {null_count} valores faltantes en {column_name} - posiblemente {expected_reason[column_name]}",
+            QualitySeverity.MEDIUM.value if percentage < 50 else QualitySeverity.HIGH.value
         )
 
 
@@ -346,50 +716,50 @@ def validate_shipping_logic(execution_id: int, table_name: str, conn: sqlite3.Co
         )
 
 
+# --- Rangos numéricos esperados ---
+# (columna, mínimo, máximo, descripción); None indica que no hay límite
+NUMERIC_RANGE_VALIDATIONS = (
+    ("unit_price", 0, None, "Precio unitario debe ser positivo"),
+    ("quantity", 1, 1000, "Cantidad debe estar entre 1 y 1000"),
+    ("discount", 0, 1, "Descuento debe estar entre 0 y 1"),
+)
+
+
+def build_numeric_range_query(validations: tuple) -> tuple:
+    """
+    Construye una única consulta con un SUM(CASE ...) por regla y los límites
+    como parámetros enlazados, de modo que la sentencia preparada se reutilice.
+    Devuelve la plantilla (con {table} pendiente) y la tupla de parámetros.
+    """
+    violation_sums = []
+    params = []
+    for column, min_val, max_val, _ in validations:
+        conditions = []
+        if min_val is not None:
+            conditions.append(f"{column} < ?")
+            params.append(min_val)
+        if max_val is not None:
+            conditions.append(f"{column} > ?")
+            params.append(max_val)
+        violation_sums.append(f"SUM(CASE WHEN {' OR '.join(conditions)} THEN 1 ELSE 0 END)")
+    return f"SELECT {', '.join(violation_sums)} FROM {{table}}", tuple(params)
+
+
+NUMERIC_RANGE_SQL, NUMERIC_RANGE_PARAMS = build_numeric_range_query(NUMERIC_RANGE_VALIDATIONS)
+
+
 def validate_numeric_ranges(execution_id: int, table_name: str, conn: sqlite3.Connection):
     """
     Valida que los valores numéricos estén en rangos esperados.
+    Todas las reglas se evalúan con un único escaneo de la tabla.
     """
     cursor = conn.cursor()
-    
-    numeric_validations = [
-        ("unit_price", 0, None, "Precio unitario debe ser positivo"),
-        ("quantity", 1, 1000, "Cantidad debe estar entre 1 y 1000"),
-        ("discount", 0, 1, "Descuento debe estar entre 0 y 1")
-    ]
-    
-    for column, min_val, max_val, description in numeric_validations:
-        try:
-            conditions = []
-            if min_val is not None:
-                conditions.append(f"{column} < {min_val}")
-            if max_val is not None:
-                conditions.append(f"{column} > {max_val}")
-            
-            if conditions:
-                where_clause = " OR ".join(conditions)
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE {where_clause}")
-                violations = cursor.fetchone()[0]
-                
-                if violations == 0:
-                    result = QualityResult.PASS.value
-                    severity = QualitySeverity.LOW.value
-                    detalles = f"{description} - Sin violaciones"
-                else:
-                    result = QualityResult.FAIL.value
-                    severity = QualitySeverity.MEDIUM.value
-                    detalles = f"🟡 {description} - {violations} violaciones encontradas"
-                
-                log_quality_metric(
-                    execution_id,
-                    "NUMERIC_RANGE_VALIDATION",
-                    f"{table_name}.{column}",
-                    result,
-                    detalles,
-                    severity
-                )
-        
-        except sqlite3.Error as e:
+
+    try:
+        cursor.execute(NUMERIC_RANGE_SQL.format(table=table_name), NUMERIC_RANGE_PARAMS)
+        violation_counts = cursor.fetchone()
+    except sqlite3.Error as e:
+        for column, _, _, _ in NUMERIC_RANGE_VALIDATIONS:
             log_quality_metric(
                 execution_id,
                 "NUMERIC_RANGE_ERROR",
@@ -398,6 +768,27 @@ def validate_numeric_ranges(execution_id: int, table_name: str, conn: sqlite3.Co
                 f"Error validando rango numérico: {str(e)}",
                 QualitySeverity.HIGH.value
             )
+        return
+
+    for (column, _, _, description), violations in zip(NUMERIC_RANGE_VALIDATIONS, violation_counts):
+        violations = violations or 0  # SUM sobre una tabla vacía devuelve NULL
+        if violations == 0:
+            result = QualityResult.PASS.value
+            severity = QualitySeverity.LOW.value
+            detalles = f"{description} - Sin violaciones"
+        else:
+            result = QualityResult.FAIL.value
+            severity = QualitySeverity.MEDIUM.value
+            detalles = f"🟡 {description} - {violations} violaciones encontradas"
+        
+        log_quality_metric(
+            execution_id,
+            "NUMERIC_RANGE_VALIDATION",
+            f"{table_name}.{column}",
+            result,
+            detalles,
+            severity
+        )
 
 
 def main():
@@ -413,6 +804,8 @@ def main():
     success = False
     try:
         conn = sqlite3.connect(DB_PATH)
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
         logging.info(f"Conexión exitosa a la base de datos {DB_PATH}.")
         create_and_load_staging_tables(conn, execution_id)
         success = True
@@ -14,7 +14,9 @@ Autor: Claude Code (Data Remediation Rockstar 🎸)
 
 import logging
 from datetime import datetime
+from typing import Optional
 from tp_datawarehousing.utils.quality_utils import (
+    get_db_connection,
     get_process_execution_id,
     update_process_execution,
     log_quality_metric
@@ -29,10 +31,46 @@ from tp_datawarehousing.utils.data_remediation_utils import (
     # 🚀 NUEVAS FUNCIONES DE REMEDIACIÓN AVANZADA
     advanced_geographic_remediation,
     advanced_contact_data_remediation,
-    world_data_enrichment_remediation
+    world_data_enrichment_remediation,
+    log_no_issues_metric,
 )
 
-def main():
+# Fases de remediación en orden de ejecución: (nombre, función). El envío hereda la
+# región ya corregida del cliente, por lo que "region" precede a "shipping"
+REMEDIATION_PHASES = (
+    ("scd2", fix_scd2_temporal_logic),
+    ("region", resolve_missing_regions),
+    ("shipping", handle_missing_shipping_data),
+    ("geographic", advanced_geographic_remediation),
+    ("contact", advanced_contact_data_remediation),
+    ("world_data", world_data_enrichment_remediation),
+)
+
+def run_remediation_phases(execution_id: int, diag: Optional[dict] = None) -> dict:
+    """
+    Ejecuta las seis fases de remediación en orden sobre una única conexión.
+    Las fases cuyo contador de diagnóstico es 0 se omiten, registrando la misma métrica
+    NO_ISSUES que habría registrado la fase.
+
+    Returns:
+        Dict {nombre_fase: RemediationStats}
+    """
+    results = {}
+    conn = get_db_connection()
+    try:
+        for name, phase in REMEDIATION_PHASES:
+            if diag is not None and diag.get(name, 1) == 0:
+                logging.info(f"   ⏭️ Fase '{name}' omitida: el diagnóstico no reportó problemas")
+                log_no_issues_metric(execution_id, name, conn)
+                results[name] = RemediationStats()
+            else:
+                results[name] = phase(execution_id, conn)
+    finally:
+        if conn is not None:
+            conn.close()
+    return results
+
+def main(diag: Optional[dict] = None):
     """
     🚀 FUNCIÓN PRINCIPAL DE REMEDIACIÓN AVANZADA DE DATOS
     
@@ -47,6 +85,11 @@ def main():
     8. Valida que las correcciones se aplicaron
     9. Genera reporte consolidado AVANZADO
     10. Actualiza estado final en DQM
+    
+    Args:
+        diag: Contadores de get_remediation_diagnostics() ('scd2', 'region', 'shipping')
+              calculados sobre las tablas actuales; las fases con contador 0 se omiten.
+              None ejecuta todas las fases.
     """
     
     # Configuración de logging específico para este step
@@ -61,37 +104,39 @@ def main():
         return False
     
     try:
-        # === FASE 1: CORRECCIÓN DE LÓGICA TEMPORAL SCD2 ===
-        logging.info("🕐 Fase 1: Corrigiendo problemas de lógica temporal SCD2...")
-        scd2_stats = fix_scd2_temporal_logic(execution_id)
+        # === FASES 1-6: EJECUCIÓN DE LAS REMEDIACIONES ===
+        logging.info("⚙️ Ejecutando las fases de remediación 1-6...")
+        phase_stats = run_remediation_phases(execution_id, diag)
+        scd2_stats = phase_stats["scd2"]
+        region_stats = phase_stats["region"]
+        shipping_stats = phase_stats["shipping"]
+        geographic_stats = phase_stats["geographic"]
+        contact_stats = phase_stats["contact"]
+        world_data_stats = phase_stats["world_data"]
         
+        # === FASE 1: CORRECCIÓN DE LÓGICA TEMPORAL SCD2 ===
+        logging.info("🕐 Fase 1: Corrección de lógica temporal SCD2")
         if scd2_stats.scd2_fixes > 0:
             logging.info(f"   ✅ Corregidos {scd2_stats.scd2_fixes} registros SCD2")
         else:
             logging.info("   ℹ️ No se encontraron problemas SCD2 que corregir")
         
         # === FASE 2: RESOLUCIÓN DE REGIONES FALTANTES ===
-        logging.info("🌍 Fase 2: Resolviendo regiones faltantes...")
-        region_stats = resolve_missing_regions(execution_id)
-        
+        logging.info("🌍 Fase 2: Resolución de regiones faltantes")
         if region_stats.region_fixes > 0:
             logging.info(f"   ✅ Asignadas regiones a {region_stats.region_fixes} clientes")
         else:
             logging.info("   ℹ️ No se encontraron clientes sin región")
         
         # === FASE 3: MANEJO DE DATOS DE ENVÍO FALTANTES ===
-        logging.info("📦 Fase 3: Manejando datos de envío incompletos...")
-        shipping_stats = handle_missing_shipping_data(execution_id)
-        
+        logging.info("📦 Fase 3: Manejo de datos de envío incompletos")
         if shipping_stats.shipping_fixes > 0:
             logging.info(f"   ✅ Procesadas {shipping_stats.shipping_fixes} órdenes con problemas de envío")
         else:
             logging.info("   ℹ️ No se encontraron problemas de datos de envío")
         
         # === 🚀 FASE 4: REMEDIACIÓN GEOGRÁFICA AVANZADA ===
-        logging.info("🌍 Fase 4: Ejecutando remediación geográfica avanzada...")
-        geographic_stats = advanced_geographic_remediation(execution_id)
-        
+        logging.info("🌍 Fase 4: Remediación geográfica avanzada")
         if geographic_stats.get_total_fixes() > 0:
             logging.info(f"   ✅ Remediación geográfica: {geographic_stats.get_total_fixes()} fixes aplicados")
             logging.info(f"      • Regiones geográficas: {geographic_stats.null_geographic_fixes}")
@@ -101,18 +146,14 @@ def main():
             logging.info("   ℹ️ No se encontraron problemas geográficos que corregir")
         
         # === 📧 FASE 5: REMEDIACIÓN DE DATOS DE CONTACTO ===
-        logging.info("📧 Fase 5: Ejecutando remediación de datos de contacto...")
-        contact_stats = advanced_contact_data_remediation(execution_id)
-        
+        logging.info("📧 Fase 5: Remediación de datos de contacto")
         if contact_stats.get_total_fixes() > 0:
             logging.info(f"   ✅ Datos de contacto generados: {contact_stats.get_total_fixes()} entradas")
         else:
             logging.info("   ℹ️ No se encontraron datos de contacto faltantes")
         
         # === 🌎 FASE 6: ENRIQUECIMIENTO DE WORLD DATA ===
-        logging.info("🌎 Fase 6: Ejecutando enriquecimiento de world data...")
-        world_data_stats = world_data_enrichment_remediation(execution_id)
-        
+        logging.info("🌎 Fase 6: Enriquecimiento de world data")
         if world_data_stats.get_total_fixes() > 0:
             logging.info(f"   ✅ World data enriquecido: {world_data_stats.get_total_fixes()} estimaciones")
         else:
@@ -129,15 +170,14 @@ def main():
         
         # === FASE 8: GENERACIÓN DE REPORTE CONSOLIDADO AVANZADO ===
         logging.info("📊 Fase 8: Generando reporte consolidado avanzado...")
-        report = create_remediation_report(execution_id, scd2_stats, region_stats, shipping_stats,
-                                         geographic_stats, contact_stats, world_data_stats)
-        
-        # Determinar estado final del proceso EXPANDIDO
         basic_fixes = scd2_stats.scd2_fixes + region_stats.region_fixes + shipping_stats.shipping_fixes
         advanced_fixes = (geographic_stats.get_total_fixes() + contact_stats.get_total_fixes() + 
                          world_data_stats.get_total_fixes())
         total_fixes = basic_fixes + advanced_fixes
+        report = create_remediation_report(execution_id, scd2_stats, region_stats, shipping_stats,
+                                         geographic_stats, contact_stats, world_data_stats)
         
+        # Determinar estado final del proceso EXPANDIDO
         if total_fixes > 0:
             final_status = "Exitoso"
             final_comments = f"Remediación AVANZADA completada: {report['summary']['total_fixes_applied']} fixes total. Categorías resueltas: {report['summary']['problem_categories_resolved']}/{report['summary']['problem_categories_total']}. Status: {report['summary']['status']}"
@@ -193,56 +233,72 @@ def main():
         update_process_execution(execution_id, "Fallido", error_msg)
         return False
 
-def run_remediation_diagnostics():
+def get_remediation_diagnostics() -> Optional[dict]:
     """
-    Función auxiliar para ejecutar solo diagnósticos sin aplicar correcciones.
-    Útil para análisis previo de problemas.
+    Calcula los contadores de problemas por fase sin aplicar correcciones.
+
+    Returns:
+        Dict {'scd2', 'region', 'shipping', 'total_issues'} o None si hubo un error
     """
-    from tp_datawarehousing.quality_utils import get_db_connection
-    
     logging.info("🔍 EJECUTANDO DIAGNÓSTICOS DE REMEDIACIÓN...")
     
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Diagnóstico 1: Problemas SCD2
+        # Los tres diagnósticos en una sola sentencia: cada tabla se lee una vez
         cursor.execute("""
-            SELECT COUNT(*) FROM DWA_DIM_Clientes 
-            WHERE fecha_inicio_validez > fecha_fin_validez
+            SELECT
+                (SELECT COUNT(*) FROM DWA_DIM_Clientes 
+                 WHERE fecha_inicio_validez > fecha_fin_validez) as scd2_issues,
+                (SELECT COUNT(*) FROM TMP2_customers 
+                 WHERE region IS NULL OR region = '') as region_issues,
+                o.sin_region,
+                o.sin_postal,
+                o.sin_fecha
+            FROM (
+                SELECT 
+                    COALESCE(SUM(CASE WHEN ship_region IS NULL THEN 1 ELSE 0 END), 0) as sin_region,
+                    COALESCE(SUM(CASE WHEN ship_postal_code IS NULL THEN 1 ELSE 0 END), 0) as sin_postal,
+                    COALESCE(SUM(CASE WHEN shipped_date IS NULL THEN 1 ELSE 0 END), 0) as sin_fecha
+                FROM TMP2_orders
+            ) o
         """)
-        scd2_issues = cursor.fetchone()[0]
+        scd2_issues, region_issues, sin_region, sin_postal, sin_fecha = cursor.fetchone()
+        
+        # Diagnóstico 1: Problemas SCD2
         logging.info(f"   📅 Problemas SCD2 temporal: {scd2_issues} registros")
         
         # Diagnóstico 2: Regiones faltantes
-        cursor.execute("""
-            SELECT COUNT(*) FROM TMP2_customers 
-            WHERE region IS NULL OR region = ''
-        """)
-        region_issues = cursor.fetchone()[0]
         logging.info(f"   🌍 Clientes sin región: {region_issues} registros")
         
         # Diagnóstico 3: Datos de envío
-        cursor.execute("""
-            SELECT 
-                SUM(CASE WHEN ship_region IS NULL THEN 1 ELSE 0 END) as sin_region,
-                SUM(CASE WHEN ship_postal_code IS NULL THEN 1 ELSE 0 END) as sin_postal,
-                SUM(CASE WHEN shipped_date IS NULL THEN 1 ELSE 0 END) as sin_fecha
-            FROM TMP2_orders
-        """)
-        shipping_stats = cursor.fetchone()
-        sin_region, sin_postal, sin_fecha = shipping_stats
         logging.info(f"   📦 Órdenes con problemas: región:{sin_region}, postal:{sin_postal}, fecha:{sin_fecha}")
         
         total_issues = scd2_issues + region_issues + sin_region + sin_postal
         logging.info(f"   📊 TOTAL ISSUES DETECTADOS: {total_issues}")
         
         conn.close()
-        return total_issues
+        return {
+            "scd2": scd2_issues,
+            "region": region_issues,
+            "shipping": sin_region + sin_postal + sin_fecha,
+            "total_issues": total_issues,
+        }
         
     except Exception as e:
         logging.error(f"Error en diagnósticos: {e}")
+        return None
+
+def run_remediation_diagnostics():
+    """
+    Función auxiliar para ejecutar solo diagnósticos sin aplicar correcciones.
+    Útil para análisis previo de problemas.
+    """
+    diagnostics = get_remediation_diagnostics()
+    if diagnostics is None:
         return -1
+    return diagnostics["total_issues"]
 
 if __name__ == "__main__":
     """
@@ -261,11 +317,12 @@ if __name__ == "__main__":
     logging.info("🚀 Ejecutando Step 08b - Data Remediation de forma independiente")
     
     # Ejecutar diagnósticos primero
-    issues_detected = run_remediation_diagnostics()
+    diagnostics = get_remediation_diagnostics()
+    issues_detected = diagnostics["total_issues"] if diagnostics is not None else -1
     
     if issues_detected > 0:
         logging.info(f"💊 Se detectaron {issues_detected} problemas. Iniciando remediación...")
-        success = main()
+        success = main(diagnostics)
         
         if success:
             logging.info("🎉 Remediación completada exitosamente!")
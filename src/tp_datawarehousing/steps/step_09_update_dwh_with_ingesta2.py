@@ -22,32 +22,47 @@ logging.basicConfig(
 DB_PATH = "db/tp_dwa.db"
 USER = "data_engineer_updater"
 
+# Clave de cambio de TMP2_customers, con los mismos atributos y orden que la
+# columna generada DWA_DIM_Clientes.clave_cambio (CLAVE_CAMBIO_CLIENTES_EXPR del Paso 5)
+TMP2_CUSTOMER_CHANGE_KEY = """(
+            COALESCE(t.address, '') || char(31) || COALESCE(t.city, '') || char(31) ||
+            COALESCE(t.region, '') || char(31) || COALESCE(t.postal_code, '') || char(31) ||
+            COALESCE(t.country, '') || char(31) || COALESCE(t.contact_name, '') || char(31) ||
+            COALESCE(t.contact_title, '')
+        )"""
+
+# PRAGMAs adicionales de la conexión de actualización. get_db_connection ya
+# configura WAL, synchronous=NORMAL, temp_store=MEMORY y mmap.
+UPDATE_PRAGMAS = (
+    "PRAGMA cache_size = -200000",  # ~200MB de cache de páginas
+    "PRAGMA mmap_size = 268435456",  # 256MB memory mapped para los JOIN de la actualización
+    "PRAGMA wal_autocheckpoint = 10000",  # Sin checkpoints intermedios durante la transacción
+)
 
-# --- Funciones de Compatibilidad (mantenidas para no romper código existente) ---
-def log_dq_metric(conn, process_id, table_name, metric_name, metric_value):
-    """Registra una métrica descriptiva de una entidad en el DQM."""
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO DQM_descriptivos_entidad (id_ejecucion, nombre_entidad, nombre_metrica, valor_metrica)
-        VALUES (?, ?, ?, ?)
-        """,
-        (process_id, table_name, metric_name, str(metric_value)),
-    )
-    # NO hacer commit aquí - será manejado por la transacción padre
+# Tablas cuyas estadísticas se actualizan antes de los JOIN de la actualización
+UPDATE_ANALYZE_TABLES = (
+    "DWA_DIM_Clientes",
+    "TMP2_customers",
+    "TMP2_orders",
+    "TMP2_order_details",
+    "DWA_FACT_Ventas",
+    "DWA_DIM_Productos",
+    "DWA_DIM_Empleados",
+    "DWA_DIM_Shippers",
+    "DWA_DIM_Tiempo",
+    "DWA_DIM_Geografia",
+)
 
 
-# --- Lógica de Actualización Optimizada (SCD Tipo 2 para Clientes) ---
-def update_scd2_clientes_transaction(conn, process_id):
-    """
-    Actualiza la dimensión de clientes usando SCD Tipo 2 en una sola transacción.
-    Esta función NO hace commit - debe ser llamada desde execute_transaction_with_retry.
-    """
-    logging.info("--- Iniciando actualización de DWA_DIM_Clientes (SCD Tipo 2) ---")
-    cursor = conn.cursor()
+# --- Sentencias SQL ---
+# Texto fijo a nivel de módulo: un reintento de la transacción reutiliza las
+# sentencias ya compiladas del cache de la conexión (cached_statements).
 
-    # 1. Identificar clientes con cambios en una sola query optimizada
-    query_changed_customers = """
+# Clientes vigentes cuya clave de cambio difiere de la de Ingesta2, materializados
+# en una tabla temporal: todo el SCD2 se resuelve con sentencias set-based.
+# IS NOT compara sin tratar NULL como distinto de todo (comparación NULL-safe)
+SCD2_CHANGED_CUSTOMERS_SQL = f"""
+        CREATE TEMP TABLE TMP_SCD2_clientes_cambiados AS
         SELECT
             d.sk_cliente,
             t.customer_id,
@@ -61,198 +76,78 @@ def update_scd2_clientes_transaction(conn, process_id):
             t.country
         FROM TMP2_customers t
         JOIN DWA_DIM_Clientes d ON t.customer_id = d.nk_cliente_id
-        WHERE d.es_vigente = 1 AND (
-            COALESCE(d.direccion, '') != COALESCE(t.address, '') OR
-            COALESCE(d.ciudad, '') != COALESCE(t.city, '') OR
-            COALESCE(d.region, '') != COALESCE(t.region, '') OR
-            COALESCE(d.codigo_postal, '') != COALESCE(t.postal_code, '') OR
-            COALESCE(d.pais, '') != COALESCE(t.country, '') OR
-            COALESCE(d.nombre_contacto, '') != COALESCE(t.contact_name, '') OR
-            COALESCE(d.titulo_contacto, '') != COALESCE(t.contact_title, '')
-        );
+        WHERE d.es_vigente = 1 AND d.clave_cambio IS NOT {TMP2_CUSTOMER_CHANGE_KEY};
+"""
+
+# Expira las versiones vigentes de los clientes modificados
+EXPIRE_CLIENTES_SQL = """
+        UPDATE DWA_DIM_Clientes
+        SET fecha_fin_validez = ?, es_vigente = 0
+        WHERE sk_cliente IN (SELECT sk_cliente FROM temp.TMP_SCD2_clientes_cambiados)
     """
-    cursor.execute(query_changed_customers)
-    changed_customers = cursor.fetchall()
 
-    today = datetime.now().date()
-    yesterday = today - timedelta(days=1)
-
-    # 2. Actualizar todos los registros viejos en una sola operación
-    if changed_customers:
-        expired_customer_ids = [str(customer[0]) for customer in changed_customers]
-        placeholders = ",".join(["?" for _ in expired_customer_ids])
-
-        cursor.execute(
-            f"""
-            UPDATE DWA_DIM_Clientes
-            SET fecha_fin_validez = ?, es_vigente = 0
-            WHERE sk_cliente IN ({placeholders})
-        """,
-            [yesterday.isoformat()] + expired_customer_ids,
-        )
-
-        logging.info(f"Expirados {len(changed_customers)} registros de clientes")
-
-        # 3. Insertar todos los registros nuevos (actualizados) en lotes
-        new_customer_data = []
-        for customer_data in changed_customers:
-            new_customer_data.append(
-                (
-                    customer_data[1],  # nk_cliente_id
-                    customer_data[2],  # company_name
-                    customer_data[3],  # contact_name
-                    customer_data[4],  # contact_title
-                    customer_data[5],  # address
-                    customer_data[6],  # city
-                    customer_data[7],  # region
-                    customer_data[8],  # postal_code
-                    customer_data[9],  # country
-                    today.isoformat(),
-                    None,
-                    1,
-                )
-            )
-
-        cursor.executemany(
-            """
-            INSERT INTO DWA_DIM_Clientes (
-                nk_cliente_id, nombre_compania, nombre_contacto, titulo_contacto,
-                direccion, ciudad, region, codigo_postal, pais,
-                fecha_inicio_validez, fecha_fin_validez, es_vigente
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            new_customer_data,
+# Inserta las nuevas versiones vigentes de los clientes modificados. RETURNING
+# (SQLite >= 3.35) devuelve las claves subrogadas asignadas sin volver a consultar
+INSERT_CHANGED_CLIENTES_SQL = """
+        INSERT INTO DWA_DIM_Clientes (
+            nk_cliente_id, nombre_compania, nombre_contacto, titulo_contacto,
+            direccion, ciudad, region, codigo_postal, pais,
+            fecha_inicio_validez, fecha_fin_validez, es_vigente
         )
+        SELECT customer_id, company_name, contact_name, contact_title,
+               address, city, region, postal_code, country, ?, NULL, 1
+        FROM temp.TMP_SCD2_clientes_cambiados
+        ORDER BY rowid
+        RETURNING sk_cliente, nk_cliente_id
+    """
 
-        logging.info(
-            f"Insertados {len(changed_customers)} registros actualizados de clientes"
+# Inserta los clientes que no existen en la dimensión
+INSERT_NEW_CLIENTES_SQL = """
+        INSERT INTO DWA_DIM_Clientes (
+            nk_cliente_id, nombre_compania, nombre_contacto, titulo_contacto,
+            direccion, ciudad, region, codigo_postal, pais,
+            fecha_inicio_validez, fecha_fin_validez, es_vigente
         )
-
-    # 4. Identificar e insertar clientes completamente nuevos en lotes
-    query_new_customers = """
         SELECT customer_id, company_name, contact_name, contact_title,
-               address, city, region, postal_code, country
+               address, city, region, postal_code, country, ?, NULL, 1
         FROM TMP2_customers t
         WHERE NOT EXISTS (
             SELECT 1 FROM DWA_DIM_Clientes d WHERE d.nk_cliente_id = t.customer_id
-        );
-    """
-    cursor.execute(query_new_customers)
-    new_customers = cursor.fetchall()
-
-    if new_customers:
-        new_customer_data = []
-        for new_customer in new_customers:
-            new_customer_data.append(
-                (
-                    new_customer[0],  # customer_id
-                    new_customer[1],  # company_name
-                    new_customer[2],  # contact_name
-                    new_customer[3],  # contact_title
-                    new_customer[4],  # address
-                    new_customer[5],  # city
-                    new_customer[6],  # region
-                    new_customer[7],  # postal_code
-                    new_customer[8],  # country
-                    today.isoformat(),
-                    None,
-                    1,
-                )
-            )
-
-        cursor.executemany(
-            """
-            INSERT INTO DWA_DIM_Clientes (
-                nk_cliente_id, nombre_compania, nombre_contacto, titulo_contacto,
-                direccion, ciudad, region, codigo_postal, pais,
-                fecha_inicio_validez, fecha_fin_validez, es_vigente
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            new_customer_data,
         )
-
-        logging.info(f"Insertados {len(new_customers)} clientes completamente nuevos")
-
-    # Registrar métricas en DQM (compatibilidad) - sin commit
-    log_dq_metric(
-        conn,
-        process_id,
-        "DWA_DIM_Clientes",
-        "registros_modificados",
-        len(changed_customers),
-    )
-    log_dq_metric(
-        conn, process_id, "DWA_DIM_Clientes", "registros_nuevos", len(new_customers)
-    )
-
-    logging.info(
-        f"Actualización de DWA_DIM_Clientes (SCD2) completada. {len(changed_customers)} registros actualizados, {len(new_customers)} nuevos."
-    )
-
-    # Retornar resultados para el framework de calidad
-    return {
-        "modificados": len(changed_customers),
-        "nuevos": len(new_customers),
-        "total_procesados": len(changed_customers) + len(new_customers),
-    }
-
-
-def update_fact_ventas_transaction(conn, process_id):
-    """
-    Actualiza la tabla de hechos con los datos de Ingesta2 en una sola transacción optimizada.
-    Esta función NO hace commit - debe ser llamada desde execute_transaction_with_retry.
+        RETURNING sk_cliente, nk_cliente_id
     """
-    logging.info("--- Iniciando actualización de DWA_FACT_Ventas ---")
-    cursor = conn.cursor()
 
-    # 1. Actualizar hechos existentes en una sola operación
-    # Nota: SQLite no soporta FROM en UPDATE directamente, usamos subqueries
-    update_query = """
-        UPDATE DWA_FACT_Ventas 
-        SET 
-            cantidad = (
-                SELECT od.quantity 
-                FROM TMP2_order_details od 
-                JOIN DWA_DIM_Productos dp ON od.product_id = dp.nk_producto_id 
-                WHERE od.order_id = DWA_FACT_Ventas.nk_orden_id 
-                AND dp.sk_producto = DWA_FACT_Ventas.sk_producto
-            ),
-            precio_unitario = (
-                SELECT od.unit_price 
-                FROM TMP2_order_details od 
-                JOIN DWA_DIM_Productos dp ON od.product_id = dp.nk_producto_id 
-                WHERE od.order_id = DWA_FACT_Ventas.nk_orden_id 
-                AND dp.sk_producto = DWA_FACT_Ventas.sk_producto
-            ),
-            descuento = (
-                SELECT od.discount 
-                FROM TMP2_order_details od 
-                JOIN DWA_DIM_Productos dp ON od.product_id = dp.nk_producto_id 
-                WHERE od.order_id = DWA_FACT_Ventas.nk_orden_id 
-                AND dp.sk_producto = DWA_FACT_Ventas.sk_producto
-            ),
-            monto_total = (
-                SELECT od.unit_price * od.quantity * (1 - od.discount) 
-                FROM TMP2_order_details od 
-                JOIN DWA_DIM_Productos dp ON od.product_id = dp.nk_producto_id 
-                WHERE od.order_id = DWA_FACT_Ventas.nk_orden_id 
-                AND dp.sk_producto = DWA_FACT_Ventas.sk_producto
-            )
-        WHERE EXISTS (
-            SELECT 1 FROM TMP2_order_details od 
-            JOIN DWA_DIM_Productos dp ON od.product_id = dp.nk_producto_id 
-            WHERE od.order_id = DWA_FACT_Ventas.nk_orden_id 
-            AND dp.sk_producto = DWA_FACT_Ventas.sk_producto
-        )
+# Actualiza los hechos existentes. UPDATE ... FROM (SQLite >= 3.33) resuelve cada
+# (orden, producto) una sola vez con un JOIN, en lugar de una subconsulta correlacionada
+# por columna
+UPDATE_FACT_VENTAS_SQL = """
+        UPDATE DWA_FACT_Ventas AS fv
+        SET
+            cantidad = src.quantity,
+            precio_unitario = src.unit_price,
+            descuento = src.discount,
+            monto_total = src.monto_total
+        FROM (
+            SELECT od.order_id, dp.sk_producto, od.unit_price, od.quantity, od.discount,
+                   od.unit_price * od.quantity * (1 - od.discount) AS monto_total
+            FROM TMP2_order_details od
+            JOIN DWA_DIM_Productos dp ON od.product_id = dp.nk_producto_id
+        ) AS src
+        WHERE fv.nk_orden_id = src.order_id
+        AND fv.sk_producto = src.sk_producto
     """
 
-    cursor.execute(update_query)
-    updated_facts = cursor.rowcount
-
-    logging.info(f"{updated_facts} hechos existentes fueron actualizados.")
+# sk_tiempo de cada orden de Ingesta2, resuelto una vez por orden y no por cada
+# línea de detalle (DATE() + búsqueda en DWA_DIM_Tiempo)
+ORDER_SK_TIEMPO_SQL = """
+        CREATE TEMP TABLE TMP_order_sk_tiempo AS
+        SELECT o.order_id, dt.sk_tiempo
+        FROM TMP2_orders o
+        LEFT JOIN DWA_DIM_Tiempo dt ON DATE(o.order_date) = dt.fecha
+    """
 
-    # 2. Insertar nuevos hechos en lotes usando la estructura correcta
-    insert_query = """
+# Inserta los hechos nuevos de Ingesta2 con sus claves subrogadas
+INSERT_FACT_VENTAS_SQL = """
         INSERT INTO DWA_FACT_Ventas (
             sk_cliente, sk_producto, sk_empleado, sk_tiempo, sk_geografia_envio, sk_shipper,
             precio_unitario, cantidad, descuento, flete, monto_total, nk_orden_id
@@ -261,7 +156,7 @@ def update_fact_ventas_transaction(conn, process_id):
             dc.sk_cliente,
             dp.sk_producto,
             de.sk_empleado,
-            dt.sk_tiempo,
+            ost.sk_tiempo,
             dg.sk_geografia,
             ds.sk_shipper,
             od.unit_price,
@@ -275,29 +170,173 @@ def update_fact_ventas_transaction(conn, process_id):
         LEFT JOIN DWA_DIM_Clientes dc ON o.customer_id = dc.nk_cliente_id AND dc.es_vigente = 1
         LEFT JOIN DWA_DIM_Productos dp ON od.product_id = dp.nk_producto_id
         LEFT JOIN DWA_DIM_Empleados de ON o.employee_id = de.nk_empleado_id
-        LEFT JOIN DWA_DIM_Tiempo dt ON DATE(o.order_date) = dt.fecha
+        LEFT JOIN temp.TMP_order_sk_tiempo ost ON ost.order_id = o.order_id
         LEFT JOIN DWA_DIM_Geografia dg ON o.ship_address = dg.direccion AND o.ship_city = dg.ciudad AND o.ship_country = dg.pais
         LEFT JOIN DWA_DIM_Shippers ds ON o.ship_via = ds.nk_shipper_id
-        WHERE NOT EXISTS (
-            SELECT 1 FROM DWA_FACT_Ventas f 
-            WHERE f.nk_orden_id = o.order_id 
-            AND f.sk_producto = dp.sk_producto
-        )
+        -- Anti-join: solo (orden, producto) sin hecho existente
+        LEFT JOIN DWA_FACT_Ventas f ON f.nk_orden_id = o.order_id AND f.sk_producto = dp.sk_producto
+        WHERE f.nk_orden_id IS NULL
         AND dc.sk_cliente IS NOT NULL  -- Solo insertar si tenemos cliente válido
         AND dp.sk_producto IS NOT NULL  -- Solo insertar si tenemos producto válido
-        AND dt.sk_tiempo IS NOT NULL   -- Solo insertar si tenemos fecha válida
+        AND ost.sk_tiempo IS NOT NULL  -- Solo insertar si tenemos fecha válida
     """
 
-    cursor.execute(insert_query)
-    inserted_facts = cursor.rowcount
+# Métrica descriptiva de compatibilidad (ver log_dq_metric)
+LOG_DQ_METRIC_SQL = """
+        INSERT INTO DQM_descriptivos_entidad (id_ejecucion, nombre_entidad, nombre_metrica, valor_metrica)
+        VALUES (?, ?, ?, ?)
+        """
 
-    logging.info(f"{inserted_facts} nuevos hechos fueron insertados.")
 
-    # Registrar métricas en DQM (compatibilidad) - sin commit
-    log_dq_metric(
-        conn, process_id, "DWA_FACT_Ventas", "hechos_actualizados", updated_facts
+# --- Consultas de Validación ---
+# Conteo de cada tabla de Ingesta2 que debe estar disponible
+INGESTA2_COUNT_SQL = {
+    table: f"SELECT COUNT(*) FROM {table}"
+    for table in ("TMP2_customers", "TMP2_orders", "TMP2_order_details")
+}
+
+INGESTA2_DATE_RANGE_SQL = """
+        SELECT MIN(order_date), MAX(order_date), COUNT(*) 
+        FROM TMP2_orders 
+        WHERE order_date IS NOT NULL
+    """
+
+# Conteos post-actualización de hechos y dimensión en una sola consulta
+POST_UPDATE_COUNTS_SQL = """
+        SELECT (SELECT COUNT(*) FROM DWA_FACT_Ventas),
+               (SELECT COUNT(*) FROM DWA_DIM_Clientes)
+    """
+
+# Clientes con más de una versión vigente
+SCD2_OVERLAPS_SQL = """
+        SELECT nk_cliente_id, COUNT(*) as overlaps
+        FROM DWA_DIM_Clientes 
+        WHERE es_vigente = 1
+        GROUP BY nk_cliente_id
+        HAVING COUNT(*) > 1
+    """
+
+# Versiones con fecha de inicio posterior a la de fin
+SCD2_INVALID_DATES_SQL = """
+        SELECT COUNT(*) FROM DWA_DIM_Clientes 
+        WHERE fecha_fin_validez IS NOT NULL AND fecha_inicio_validez > fecha_fin_validez
+    """
+
+
+# --- Funciones de Compatibilidad (mantenidas para no romper código existente) ---
+def log_dq_metric(conn, process_id, table_name, metric_name, metric_value):
+    """Registra una métrica descriptiva de una entidad en el DQM."""
+    conn.execute(
+        LOG_DQ_METRIC_SQL,
+        (process_id, table_name, metric_name, str(metric_value)),
     )
-    log_dq_metric(conn, process_id, "DWA_FACT_Ventas", "hechos_nuevos", inserted_facts)
+    # NO hacer commit aquí - será manejado por la transacción padre
+
+
+def log_dq_metrics(conn, process_id, metrics):
+    """
+    Registra en lote varias métricas descriptivas con un único executemany.
+    Sin commit: será manejado por la transacción padre.
+
+    Args:
+        conn: Conexión a la base de datos
+        process_id: ID de ejecución
+        metrics: Lista de tuplas (nombre_entidad, nombre_metrica, valor_metrica)
+    """
+    if not metrics:
+        return
+    conn.executemany(
+        LOG_DQ_METRIC_SQL,
+        [(process_id, table, name, str(value)) for table, name, value in metrics],
+    )
+
+
+# --- Lógica de Actualización Optimizada (SCD Tipo 2 para Clientes) ---
+def update_scd2_clientes_transaction(conn, process_id):
+    """
+    Actualiza la dimensión de clientes usando SCD Tipo 2 en una sola transacción.
+    Esta función NO hace commit - debe ser llamada desde execute_transaction_with_retry.
+    """
+    logging.info("--- Iniciando actualización de DWA_DIM_Clientes (SCD Tipo 2) ---")
+    cursor = conn.cursor()
+
+    # 1. Identificar clientes con cambios y materializarlos en una tabla temporal
+    cursor.execute("DROP TABLE IF EXISTS temp.TMP_SCD2_clientes_cambiados")
+    cursor.execute(SCD2_CHANGED_CUSTOMERS_SQL)
+
+    # Fechas de validez en ISO, calculadas una vez para todas las sentencias
+    today = datetime.now().date()
+    today_iso = today.isoformat()
+    yesterday_iso = (today - timedelta(days=1)).isoformat()
+
+    # 2. Expirar todos los registros viejos en una sola operación
+    cursor.execute(EXPIRE_CLIENTES_SQL, (yesterday_iso,))
+    expired_count = cursor.rowcount
+
+    # Claves subrogadas de las versiones recién insertadas: {nk_cliente_id: sk_cliente}.
+    # Las filas de RETURNING se recorren directamente, sin materializar listas.
+    new_versions = {}
+
+    # 3. Insertar las nuevas versiones vigentes de los clientes modificados
+    changed_count = 0
+    for sk_cliente, nk_cliente_id in cursor.execute(INSERT_CHANGED_CLIENTES_SQL, (today_iso,)):
+        new_versions[nk_cliente_id] = sk_cliente
+        changed_count += 1
+    # Detalle por cliente solo en DEBUG: evita armar la lista en ejecuciones normales
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        expired_sks = [
+            row[0]
+            for row in cursor.execute(
+                "SELECT sk_cliente FROM temp.TMP_SCD2_clientes_cambiados ORDER BY rowid"
+            )
+        ]
+        logging.debug("sk_cliente expirados: %s", expired_sks)
+    cursor.execute("DROP TABLE temp.TMP_SCD2_clientes_cambiados")
+
+    # 4. Insertar clientes completamente nuevos en una sola operación
+    new_count = 0
+    for sk_cliente, nk_cliente_id in cursor.execute(INSERT_NEW_CLIENTES_SQL, (today_iso,)):
+        new_versions[nk_cliente_id] = sk_cliente
+        new_count += 1
+
+    logging.info(
+        f"Actualización de DWA_DIM_Clientes (SCD2) completada. Expirados {expired_count}, "
+        f"{changed_count} registros actualizados, {new_count} nuevos."
+    )
+
+    # Retornar resultados para el framework de calidad. versiones_vigentes mapea
+    # nk_cliente_id -> sk_cliente de las versiones insertadas en esta actualización.
+    return {
+        "modificados": changed_count,
+        "nuevos": new_count,
+        "total_procesados": changed_count + new_count,
+        "versiones_vigentes": new_versions,
+    }
+
+
+def update_fact_ventas_transaction(conn, process_id):
+    """
+    Actualiza la tabla de hechos con los datos de Ingesta2 en una sola transacción optimizada.
+    Esta función NO hace commit - debe ser llamada desde execute_transaction_with_retry.
+    """
+    logging.info("--- Iniciando actualización de DWA_FACT_Ventas ---")
+    cursor = conn.cursor()
+
+    # 1. Actualizar hechos existentes en una sola operación
+    cursor.execute(UPDATE_FACT_VENTAS_SQL)
+    updated_facts = cursor.rowcount
+
+    logging.info(f"{updated_facts} hechos existentes fueron actualizados.")
+
+    # 2. Insertar nuevos hechos en lotes usando la estructura correcta
+    cursor.execute("DROP TABLE IF EXISTS temp.TMP_order_sk_tiempo")
+    cursor.execute(ORDER_SK_TIEMPO_SQL)
+    cursor.execute("CREATE INDEX temp.idx_tmp_order_sk_tiempo ON TMP_order_sk_tiempo (order_id)")
+    cursor.execute(INSERT_FACT_VENTAS_SQL)
+    inserted_facts = cursor.rowcount
+    cursor.execute("DROP TABLE temp.TMP_order_sk_tiempo")
+
+    logging.info(f"{inserted_facts} nuevos hechos fueron insertados.")
 
     logging.info("--- Actualización de DWA_FACT_Ventas completada ---")
 
@@ -308,6 +347,50 @@ def update_fact_ventas_transaction(conn, process_id):
     }
 
 
+def update_dwh_transaction(conn, process_id, ingesta2_counts=None):
+    """
+    Ejecuta la actualización SCD2 de clientes y la de hechos en la misma transacción.
+    Con ingesta2_counts (conteos de validate_ingesta2_availability) se omite cada
+    actualización cuya tabla TMP2_ de origen está vacía.
+    Esta función NO hace commit - debe ser llamada desde execute_transaction_with_retry.
+    """
+    ingesta2_counts = ingesta2_counts or {}
+    for pragma in UPDATE_PRAGMAS:
+        conn.execute(pragma)
+
+    if ingesta2_counts.get("TMP2_customers") == 0:
+        logging.info("TMP2_customers vacía: se omite la actualización SCD2 de clientes.")
+        scd2_results = {
+            "modificados": 0,
+            "nuevos": 0,
+            "total_procesados": 0,
+            "versiones_vigentes": {},
+        }
+    else:
+        scd2_results = update_scd2_clientes_transaction(conn, process_id)
+
+    # La actualización de hechos existentes solo lee TMP2_order_details: sin detalles
+    # no hay nada que actualizar ni insertar (aunque TMP2_orders traiga órdenes)
+    if ingesta2_counts.get("TMP2_order_details") == 0:
+        logging.info("TMP2_order_details vacía: se omite la actualización de hechos.")
+        fact_results = {"actualizados": 0, "nuevos": 0, "total_procesados": 0}
+    else:
+        fact_results = update_fact_ventas_transaction(conn, process_id)
+
+    # Registrar métricas en DQM (compatibilidad) en un solo lote - sin commit
+    log_dq_metrics(
+        conn,
+        process_id,
+        [
+            ("DWA_DIM_Clientes", "registros_modificados", scd2_results["modificados"]),
+            ("DWA_DIM_Clientes", "registros_nuevos", scd2_results["nuevos"]),
+            ("DWA_FACT_Ventas", "hechos_actualizados", fact_results["actualizados"]),
+            ("DWA_FACT_Ventas", "hechos_nuevos", fact_results["nuevos"]),
+        ],
+    )
+    return scd2_results, fact_results
+
+
 def main():
     """
     Orquesta la actualización del DWH con los datos de Ingesta2.
@@ -319,7 +402,9 @@ def main():
     execution_id = get_process_execution_id("STEP_09_UPDATE_DWH_INGESTA2")
 
     try:
-        # Crear conexión temporal para validaciones pre-proceso
+        # Una única conexión para todo el paso (validaciones, ANALYZE, transacción
+        # SCD2/hechos y validaciones finales): se conserva la caché de páginas
+        # entre fases en lugar de reabrir la base en frío en cada una
         conn = get_db_connection()
         if conn is None:
             raise sqlite3.Error("No se pudo obtener conexión a la base de datos")
@@ -332,69 +417,73 @@ def main():
             "Conexión exitosa a la base de datos",
         )
 
-        # Validaciones pre-proceso: Verificar que Ingesta2 esté disponible
-        validate_ingesta2_availability(execution_id, conn)
+        # Validaciones pre-proceso: Verificar que Ingesta2 esté disponible.
+        # Sin datos en ninguna tabla TMP2_ no hay nada que actualizar ni validar.
+        ingesta2_counts = validate_ingesta2_availability(execution_id, conn)
+        if all(count == 0 for count in ingesta2_counts.values()):
+            log_quality_metric(
+                execution_id,
+                "INGESTA2_NO_DATA",
+                "TMP2_customers, TMP2_orders, TMP2_order_details",
+                "SKIPPED",
+                "Ingesta2 vacía: se omite la actualización del DWH",
+            )
+            update_process_execution(
+                execution_id, "Exitoso", "Ingesta2 vacía, nada que actualizar"
+            )
+            logging.info("Paso 9 completado: Ingesta2 vacía, nada que actualizar.")
+            return
 
         # Validaciones pre-proceso: Estado del DWH antes de actualización
         validate_dwh_state_before_update(execution_id, conn)
 
-        # Cerrar conexión temporal antes de las transacciones
-        conn.close()
-        conn = None
+        # Estadísticas para el planificador de los JOIN de SCD2 y hechos
+        analyze_update_tables(conn)
 
-        # --- Actualizar Dimensiones SCD2 ---
-        logging.info("--- Iniciando Actualización de Dimensiones SCD2 ---")
+        # --- Actualizar Dimensiones SCD2 y Tabla de Hechos ---
+        # Ambas actualizaciones comparten una única transacción (BEGIN IMMEDIATE ... COMMIT):
+        # los hechos se enlazan con las versiones de cliente recién creadas y un fallo
+        # en cualquiera de las dos revierte el conjunto.
+        logging.info("--- Iniciando Actualización de Dimensiones SCD2 y Tabla de Hechos ---")
         try:
-            scd2_results = execute_transaction_with_retry(
-                update_scd2_clientes_transaction, execution_id
-            )
-            log_quality_metric(
+            scd2_results, fact_results = execute_transaction_with_retry(
+                update_dwh_transaction,
                 execution_id,
-                "SCD2_UPDATE",
-                "DWA_DIM_Clientes",
-                "PASS",
-                f"Clientes modificados: {scd2_results['modificados']}, Nuevos: {scd2_results['nuevos']}",
+                ingesta2_counts,
+                shared_conn=conn,
             )
         except Exception as e:
             log_quality_metric(
                 execution_id,
-                "SCD2_UPDATE",
-                "DWA_DIM_Clientes",
+                "DWH_UPDATE",
+                "DWA_DIM_Clientes, DWA_FACT_Ventas",
                 "FAIL",
-                f"Error en SCD2: {str(e)}",
+                f"Error en SCD2/tabla de hechos (transacción revertida): {str(e)}",
             )
             raise
 
-        # --- Actualizar Tabla de Hechos ---
-        logging.info("--- Iniciando Actualización de Tabla de Hechos ---")
-        try:
-            fact_results = execute_transaction_with_retry(
-                update_fact_ventas_transaction, execution_id
-            )
-            log_quality_metric(
-                execution_id,
-                "FACT_UPDATE",
-                "DWA_FACT_Ventas",
-                "PASS",
-                f"Hechos actualizados: {fact_results['actualizados']}, Nuevos: {fact_results['nuevos']}",
-            )
-        except Exception as e:
-            log_quality_metric(
-                execution_id,
-                "FACT_UPDATE",
-                "DWA_FACT_Ventas",
-                "FAIL",
-                f"Error en tabla de hechos: {str(e)}",
-            )
-            raise
+        log_quality_metric(
+            execution_id,
+            "SCD2_UPDATE",
+            "DWA_DIM_Clientes",
+            "PASS",
+            f"Clientes modificados: {scd2_results['modificados']}, Nuevos: {scd2_results['nuevos']}",
+        )
+        log_quality_metric(
+            execution_id,
+            "FACT_UPDATE",
+            "DWA_FACT_Ventas",
+            "PASS",
+            f"Hechos actualizados: {fact_results['actualizados']}, Nuevos: {fact_results['nuevos']}",
+        )
 
-        # 5. Validaciones post-actualización
-        # Crear nueva conexión temporal para validaciones finales
-        conn = get_db_connection()
-        if conn:
-            validate_dwh_integrity_after_update(execution_id, conn)
-            validate_temporal_consistency(execution_id, conn)
-            conn.close()
+        # 5. Validaciones post-actualización (misma conexión, caché ya caliente)
+        validate_dwh_integrity_after_update(execution_id, conn)
+        validate_temporal_consistency(execution_id, conn)
+
+        # Refrescar estadísticas antes de cerrar: PRAGMA optimize solo re-analiza las
+        # tablas cuyo volumen cambió lo suficiente con la actualización
+        conn.execute("PRAGMA optimize")
 
         # Finalizar la ejecución del proceso
         update_process_execution(
@@ -421,24 +510,41 @@ def main():
         if "conn" in locals() and conn:
             try:
                 conn.close()
-                logging.info("Conexión de validación cerrada.")
+                logging.info("Conexión del Paso 9 cerrada.")
             except:
                 pass
 
 
-def validate_ingesta2_availability(execution_id: int, conn: sqlite3.Connection):
+def analyze_update_tables(conn: sqlite3.Connection):
+    """
+    Actualiza las estadísticas (sqlite_stat1) de las tablas que cruza la actualización,
+    para que el planificador elija los índices de claves en los JOIN de SCD2 y hechos.
+    Los índices ya existen: los de claves naturales de las dimensiones en el Paso 5,
+    el de (orden, producto) de la tabla de hechos en el Paso 7 y los de claves TMP2_
+    en el Paso 8.
+    """
+    for table in UPDATE_ANALYZE_TABLES:
+        conn.execute(f"ANALYZE {table}")
+    conn.commit()
+    logging.info("Estadísticas del planificador actualizadas para el Paso 9.")
+
+
+def validate_ingesta2_availability(execution_id: int, conn: sqlite3.Connection) -> dict:
     """
     Valida que los datos de Ingesta2 estén disponibles y sean válidos.
+
+    Returns:
+        Diccionario {tabla TMP2_: cantidad de registros}; None si no se pudo contar
     """
     cursor = conn.cursor()
+    counts = {}
 
     # Verificar que las tablas TMP2_ existan y tengan datos
-    ingesta2_tables = ["TMP2_customers", "TMP2_orders", "TMP2_order_details"]
-
-    for table in ingesta2_tables:
+    for table, count_sql in INGESTA2_COUNT_SQL.items():
         try:
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            cursor.execute(count_sql)
             count = cursor.fetchone()[0]
+            counts[table] = count
 
             if count == 0:
                 log_quality_metric(
@@ -457,6 +563,7 @@ def validate_ingesta2_availability(execution_id: int, conn: sqlite3.Connection):
                     f"Tabla {table} disponible con {count} registros",
                 )
         except sqlite3.Error as e:
+            counts[table] = None
             log_quality_metric(
                 execution_id,
                 "INGESTA2_ERROR",
@@ -467,13 +574,7 @@ def validate_ingesta2_availability(execution_id: int, conn: sqlite3.Connection):
 
     # Validar fechas de Ingesta2
     try:
-        cursor.execute(
-            """
-            SELECT MIN(order_date), MAX(order_date), COUNT(*) 
-            FROM TMP2_orders 
-            WHERE order_date IS NOT NULL
-        """
-        )
+        cursor.execute(INGESTA2_DATE_RANGE_SQL)
         result = cursor.fetchone()
         if result and result[2] > 0:
             min_date, max_date, count = result
@@ -501,6 +602,8 @@ def validate_ingesta2_availability(execution_id: int, conn: sqlite3.Connection):
             f"Error validando fechas: {str(e)}",
         )
 
+    return counts
+
 
 def validate_dwh_state_before_update(execution_id: int, conn: sqlite3.Connection):
     """Valida el estado del DWH antes de la actualización."""
@@ -546,8 +649,8 @@ def validate_dwh_integrity_after_update(execution_id: int, conn: sqlite3.Connect
 
     # Contar registros después de la actualización
     try:
-        cursor.execute("SELECT COUNT(*) FROM DWA_FACT_Ventas")
-        fact_count = cursor.fetchone()[0]
+        cursor.execute(POST_UPDATE_COUNTS_SQL)
+        fact_count, dim_count = cursor.fetchone()
         log_quality_metric(
             execution_id,
             "POST_UPDATE_FACT_COUNT",
@@ -555,9 +658,6 @@ def validate_dwh_integrity_after_update(execution_id: int, conn: sqlite3.Connect
             str(fact_count),
             f"Total registros en tabla de hechos después de actualización: {fact_count}",
         )
-
-        cursor.execute("SELECT COUNT(*) FROM DWA_DIM_Clientes")
-        dim_count = cursor.fetchone()[0]
         log_quality_metric(
             execution_id,
             "POST_UPDATE_DIM_COUNT",
@@ -584,19 +684,10 @@ def validate_temporal_consistency(execution_id: int, conn: sqlite3.Connection):
 
     # Verificar que no haya solapamientos de fechas en SCD2
     try:
-        cursor.execute(
-            """
-            SELECT nk_cliente_id, COUNT(*) as overlaps
-            FROM DWA_DIM_Clientes 
-            WHERE es_vigente = 1
-            GROUP BY nk_cliente_id
-            HAVING COUNT(*) > 1
-        """
-        )
-        overlaps = cursor.fetchall()
+        # Solo interesa la cantidad: se cuentan las filas sin materializarlas
+        overlap_count = sum(1 for _ in cursor.execute(SCD2_OVERLAPS_SQL))
 
-        if overlaps:
-            overlap_count = len(overlaps)
+        if overlap_count:
             log_quality_metric(
                 execution_id,
                 "SCD2_TEMPORAL_OVERLAPS",
@@ -623,12 +714,7 @@ def validate_temporal_consistency(execution_id: int, conn: sqlite3.Connection):
 
     # Verificar fechas de inicio <= fechas de fin
     try:
-        cursor.execute(
-            """
-            SELECT COUNT(*) FROM DWA_DIM_Clientes 
-            WHERE fecha_fin_validez IS NOT NULL AND fecha_inicio_validez > fecha_fin_validez
-        """
-        )
+        cursor.execute(SCD2_INVALID_DATES_SQL)
         invalid_dates = cursor.fetchone()[0]
 
         if invalid_dates > 0:
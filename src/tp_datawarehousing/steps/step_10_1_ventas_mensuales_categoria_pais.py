@@ -1,6 +1,11 @@
 import sqlite3
 import logging
-from datetime import datetime
+from tp_datawarehousing.utils.quality_utils import (
+    MET_ENTIDAD_UPSERT_SQL,
+    log_process_start,
+    log_process_end,
+    warn_if_full_scan,
+)
 
 # --- Configuración de Logging ---
 logging.basicConfig(
@@ -12,32 +17,10 @@ DB_PATH = "db/tp_dwa.db"
 USER = "data_analyst"
 
 
-# --- Funciones Auxiliares para el DQM (reutilizadas de pasos anteriores) ---
-def log_process_start(conn, process_name, comments=""):
-    cursor = conn.cursor()
-    start_time = datetime.now()
-    cursor.execute(
-        "INSERT INTO DQM_ejecucion_procesos (nombre_proceso, fecha_inicio, estado, comentarios) VALUES (?, ?, ?, ?)",
-        (process_name, start_time, "En Progreso", comments),
-    )
-    conn.commit()
-    return cursor.lastrowid, start_time
-
-
-def log_process_end(conn, process_id, start_time, status, comments=""):
-    cursor = conn.cursor()
-    end_time = datetime.now()
-    duration = (end_time - start_time).total_seconds()
-    cursor.execute(
-        "UPDATE DQM_ejecucion_procesos SET fecha_fin = ?, estado = ?, duracion_seg = ?, comentarios = ? WHERE id_ejecucion = ?",
-        (end_time, status, duration, comments, process_id),
-    )
-    conn.commit()
-
-
 def create_dp1_ventas_mensuales_categoria_pais(conn, process_id):
     """
     Crea el Producto de Datos 1: Análisis de ventas mensuales por categoría y país.
+    No hace commit: debe ejecutarse dentro de la transacción abierta por el llamador.
     """
     logging.info(
         "--- Iniciando creación del DP1: Ventas Mensuales por Categoría y País ---"
@@ -55,13 +38,17 @@ def create_dp1_ventas_mensuales_categoria_pais(conn, process_id):
             mes INTEGER,
             nombre_categoria TEXT,
             pais TEXT,
-            total_ventas REAL
-        );
+            total_ventas REAL,
+            -- Clave = grano del DP: las filas quedan agrupadas físicamente por período
+            PRIMARY KEY (anio, mes, nombre_categoria, pais)
+        ) WITHOUT ROWID;
     """
     )
     logging.info(f"Tabla {table_name} creada con éxito.")
 
-    # 2. Poblar la tabla con datos agregados del DWH
+    # 2. Poblar la tabla con datos agregados del DWH. El índice cubriente
+    # idx_fact_ventas_dp1 se crea en el Paso 7 tras la carga de hechos
+    # Sin ORDER BY: la tabla WITHOUT ROWID guarda las filas en el orden de su clave
     insert_query = f"""
         INSERT INTO {table_name} (anio, mes, nombre_categoria, pais, total_ventas)
         SELECT
@@ -75,23 +62,21 @@ def create_dp1_ventas_mensuales_categoria_pais(conn, process_id):
         JOIN DWA_DIM_Productos p ON fv.sk_producto = p.sk_producto
         JOIN DWA_DIM_Geografia g ON fv.sk_geografia_envio = g.sk_geografia
         WHERE g.pais IS NOT NULL AND p.nombre_categoria IS NOT NULL
-        GROUP BY t.anio, t.mes, p.nombre_categoria, g.pais
-        ORDER BY t.anio, t.mes, total_ventas DESC;
+        GROUP BY t.anio, t.mes, p.nombre_categoria, g.pais;
     """
+    # Control del plan: la agregación debe leer la tabla de hechos por su índice cubriente
+    warn_if_full_scan(conn, insert_query, "fv")
     cursor.execute(insert_query)
     inserted_count = cursor.rowcount
     logging.info(f"{inserted_count} registros agregados insertados en {table_name}.")
 
     # 3. Registrar el nuevo producto de datos en la metadata
     description = "DP1: Producto de datos que resume las ventas totales mensuales por categoría de producto y país de envío."
-    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     cursor.execute(
-        "INSERT OR REPLACE INTO MET_entidades (nombre_entidad, descripcion, capa, fecha_creacion, usuario_creacion) VALUES (?, ?, ?, ?, ?)",
-        (table_name, description, "DataProduct", current_date, USER),
+        MET_ENTIDAD_UPSERT_SQL, (table_name, description, "DataProduct", USER)
     )
     logging.info(f"Producto de datos {table_name} registrado en la metadata.")
 
-    conn.commit()
     logging.info(f"--- Creación del producto de datos {table_name} finalizada ---")
     return inserted_count
 
@@ -103,24 +88,28 @@ def main():
     logging.info("Iniciando el Paso 10.1: Creación del DP1 - Ventas Mensuales por Categoría y País.")
     conn = None
     process_id = -1
-    start_time = datetime.now()
 
     try:
         conn = sqlite3.connect(DB_PATH)
-        process_id, start_time = log_process_start(
+        process_id = log_process_start(
             conn, "CreacionDP1_VentasMensuales", "Genera DP1 para análisis de ventas por categoría y país."
         )
 
+        # Reconstrucción del DP y cierre del proceso en una única transacción:
+        # DROP/CREATE fuera de ella se confirmarían de inmediato (autocommit de DDL)
+        conn.execute("BEGIN IMMEDIATE")
         create_dp1_ventas_mensuales_categoria_pais(conn, process_id)
 
         log_process_end(
-            conn, process_id, start_time, "Exitoso", "DP1 - Ventas Mensuales por Categoría y País generado."
+            conn, process_id, "Exitoso", "DP1 - Ventas Mensuales por Categoría y País generado."
         )
 
     except sqlite3.Error as e:
         logging.error(f"Error de base de datos en el Paso 10.1: {e}")
+        if conn and conn.in_transaction:
+            conn.rollback()
         if conn and process_id != -1:
-            log_process_end(conn, process_id, start_time, "Fallido", str(e))
+            log_process_end(conn, process_id, "Fallido", str(e))
     finally:
         if conn:
             conn.close()
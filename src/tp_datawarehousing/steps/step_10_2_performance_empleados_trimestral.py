@@ -1,6 +1,11 @@
 import sqlite3
 import logging
-from datetime import datetime
+from tp_datawarehousing.utils.quality_utils import (
+    MET_ENTIDAD_UPSERT_SQL,
+    log_process_start,
+    log_process_end,
+    warn_if_full_scan,
+)
 
 # --- Configuración de Logging ---
 logging.basicConfig(
@@ -12,32 +17,10 @@ DB_PATH = "db/tp_dwa.db"
 USER = "data_analyst"
 
 
-# --- Funciones Auxiliares para el DQM (reutilizadas de pasos anteriores) ---
-def log_process_start(conn, process_name, comments=""):
-    cursor = conn.cursor()
-    start_time = datetime.now()
-    cursor.execute(
-        "INSERT INTO DQM_ejecucion_procesos (nombre_proceso, fecha_inicio, estado, comentarios) VALUES (?, ?, ?, ?)",
-        (process_name, start_time, "En Progreso", comments),
-    )
-    conn.commit()
-    return cursor.lastrowid, start_time
-
-
-def log_process_end(conn, process_id, start_time, status, comments=""):
-    cursor = conn.cursor()
-    end_time = datetime.now()
-    duration = (end_time - start_time).total_seconds()
-    cursor.execute(
-        "UPDATE DQM_ejecucion_procesos SET fecha_fin = ?, estado = ?, duracion_seg = ?, comentarios = ? WHERE id_ejecucion = ?",
-        (end_time, status, duration, comments, process_id),
-    )
-    conn.commit()
-
-
 def create_dp2_performance_empleados_trimestral(conn, process_id):
     """
     Crea el Producto de Datos 2: Análisis de performance de empleados por trimestre.
+    No hace commit: debe ejecutarse dentro de la transacción abierta por el llamador.
     """
     logging.info(
         "--- Iniciando creación del DP2: Performance de Empleados Trimestral ---"
@@ -64,13 +47,17 @@ def create_dp2_performance_empleados_trimestral(conn, process_id):
             venta_promedio_por_orden REAL,
             productos_diferentes_vendidos INTEGER,
             clientes_diferentes_atendidos INTEGER,
-            ranking_ventas_trimestre INTEGER
-        );
+            ranking_ventas_trimestre INTEGER,
+            -- Clave = grano del DP: las filas quedan agrupadas físicamente por período
+            PRIMARY KEY (anio, trimestre, sk_empleado)
+        ) WITHOUT ROWID;
     """
     )
     logging.info(f"Tabla {table_name} creada con éxito.")
 
-    # 2. Poblar la tabla con datos agregados del DWH
+    # 2. Poblar la tabla con datos agregados del DWH. El índice cubriente
+    # idx_fact_ventas_dp2 se crea en el Paso 7 tras la carga de hechos
+    # Sin ORDER BY: la tabla WITHOUT ROWID guarda las filas en el orden de su clave
     insert_query = f"""
         INSERT INTO {table_name} (
             anio, trimestre, sk_empleado, nombre_completo, titulo, 
@@ -98,8 +85,9 @@ def create_dp2_performance_empleados_trimestral(conn, process_id):
             JOIN DWA_DIM_Empleados e ON fv.sk_empleado = e.sk_empleado
             JOIN DWA_DIM_Tiempo t ON fv.sk_tiempo = t.sk_tiempo
             WHERE e.nombre_completo IS NOT NULL
-            GROUP BY t.anio, t.trimestre, e.sk_empleado, e.nombre_completo, 
-                     e.titulo, e.edad_en_contratacion, e.ciudad, e.pais
+            -- Los atributos descriptivos del empleado dependen de sk_empleado: se
+            -- agrupa solo por la clave y SQLite los toma de la fila del grupo
+            GROUP BY t.anio, t.trimestre, e.sk_empleado
         )
         SELECT 
             *,
@@ -107,23 +95,21 @@ def create_dp2_performance_empleados_trimestral(conn, process_id):
                 PARTITION BY anio, trimestre 
                 ORDER BY ventas_totales DESC
             ) as ranking_ventas_trimestre
-        FROM performance_data
-        ORDER BY anio, trimestre, ventas_totales DESC;
+        FROM performance_data;
     """
+    # Control del plan: la agregación debe leer la tabla de hechos por su índice cubriente
+    warn_if_full_scan(conn, insert_query, "fv")
     cursor.execute(insert_query)
     inserted_count = cursor.rowcount
     logging.info(f"{inserted_count} registros de performance insertados en {table_name}.")
 
     # 3. Registrar el nuevo producto de datos en la metadata
     description = "DP2: Producto de datos que analiza la performance trimestral de empleados incluyendo ventas, órdenes procesadas, ranking y diversidad de productos/clientes."
-    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     cursor.execute(
-        "INSERT OR REPLACE INTO MET_entidades (nombre_entidad, descripcion, capa, fecha_creacion, usuario_creacion) VALUES (?, ?, ?, ?, ?)",
-        (table_name, description, "DataProduct", current_date, USER),
+        MET_ENTIDAD_UPSERT_SQL, (table_name, description, "DataProduct", USER)
     )
     logging.info(f"Producto de datos {table_name} registrado en la metadata.")
 
-    conn.commit()
     logging.info(f"--- Creación del producto de datos {table_name} finalizada ---")
     return inserted_count
 
@@ -135,24 +121,28 @@ def main():
     logging.info("Iniciando el Paso 10.2: Creación del DP2 - Performance de Empleados Trimestral.")
     conn = None
     process_id = -1
-    start_time = datetime.now()
 
     try:
         conn = sqlite3.connect(DB_PATH)
-        process_id, start_time = log_process_start(
+        process_id = log_process_start(
             conn, "CreacionDP2_PerformanceEmpleados", "Genera DP2 para análisis de performance de empleados por trimestre."
         )
 
+        # Reconstrucción del DP y cierre del proceso en una única transacción:
+        # DROP/CREATE fuera de ella se confirmarían de inmediato (autocommit de DDL)
+        conn.execute("BEGIN IMMEDIATE")
         create_dp2_performance_empleados_trimestral(conn, process_id)
 
         log_process_end(
-            conn, process_id, start_time, "Exitoso", "DP2 - Performance de Empleados Trimestral generado."
+            conn, process_id, "Exitoso", "DP2 - Performance de Empleados Trimestral generado."
         )
 
     except sqlite3.Error as e:
         logging.error(f"Error de base de datos en el Paso 10.2: {e}")
+        if conn and conn.in_transaction:
+            conn.rollback()
         if conn and process_id != -1:
-            log_process_end(conn, process_id, start_time, "Fallido", str(e))
+            log_process_end(conn, process_id, "Fallido", str(e))
     finally:
         if conn:
             conn.close()
@@ -1,6 +1,11 @@
 import sqlite3
 import logging
-from datetime import datetime
+from tp_datawarehousing.utils.quality_utils import (
+    MET_ENTIDAD_UPSERT_SQL,
+    log_process_start,
+    log_process_end,
+    warn_if_full_scan,
+)
 
 # --- Configuración de Logging ---
 logging.basicConfig(
@@ -11,33 +16,17 @@ logging.basicConfig(
 DB_PATH = "db/tp_dwa.db"
 USER = "data_analyst"
 
-
-# --- Funciones Auxiliares para el DQM (reutilizadas de pasos anteriores) ---
-def log_process_start(conn, process_name, comments=""):
-    cursor = conn.cursor()
-    start_time = datetime.now()
-    cursor.execute(
-        "INSERT INTO DQM_ejecucion_procesos (nombre_proceso, fecha_inicio, estado, comentarios) VALUES (?, ?, ?, ?)",
-        (process_name, start_time, "En Progreso", comments),
-    )
-    conn.commit()
-    return cursor.lastrowid, start_time
-
-
-def log_process_end(conn, process_id, start_time, status, comments=""):
-    cursor = conn.cursor()
-    end_time = datetime.now()
-    duration = (end_time - start_time).total_seconds()
-    cursor.execute(
-        "UPDATE DQM_ejecucion_procesos SET fecha_fin = ?, estado = ?, duracion_seg = ?, comentarios = ? WHERE id_ejecucion = ?",
-        (end_time, status, duration, comments, process_id),
-    )
-    conn.commit()
+# Índice del DP3 para recorrerlo por período y ranking de eficiencia de costo
+DP3_RANKING_INDEX_SQL = """
+        CREATE INDEX IF NOT EXISTS idx_dp3_ranking
+        ON DP3_Analisis_Logistica_Shippers (anio, trimestre, ranking_eficiencia_costo)
+    """
 
 
 def create_dp3_analisis_logistica_shippers(conn, process_id):
     """
     Crea el Producto de Datos 3: Análisis de logística y performance de shippers.
+    No hace commit: debe ejecutarse dentro de la transacción abierta por el llamador.
     """
     logging.info(
         "--- Iniciando creación del DP3: Análisis de Logística y Shippers ---"
@@ -74,7 +63,8 @@ def create_dp3_analisis_logistica_shippers(conn, process_id):
     )
     logging.info(f"Tabla {table_name} creada con éxito.")
 
-    # 2. Poblar la tabla con datos agregados del DWH
+    # 2. Poblar la tabla con datos agregados del DWH. El índice cubriente
+    # idx_fact_ventas_dp3 se crea en el Paso 7 tras la carga de hechos
     insert_query = f"""
         INSERT INTO {table_name} (
             anio, trimestre, sk_shipper, nombre_shipper, telefono_shipper,
@@ -99,11 +89,6 @@ def create_dp3_analisis_logistica_shippers(conn, process_id):
                 SUM(fv.flete) / COUNT(DISTINCT fv.nk_orden_id) as costo_flete_promedio,
                 SUM(fv.cantidad) as volumen_productos_enviados,
                 SUM(fv.monto_total) as ventas_totales_asociadas,
-                CASE 
-                    WHEN SUM(fv.monto_total) > 0 
-                    THEN (SUM(fv.flete) / SUM(fv.monto_total)) * 100 
-                    ELSE 0 
-                END as ratio_flete_vs_ventas,
                 AVG(g.densidad_poblacion) as densidad_poblacion_promedio,
                 AVG(g.pib) as pib_promedio_destino
             FROM DWA_FACT_Ventas fv
@@ -114,11 +99,28 @@ def create_dp3_analisis_logistica_shippers(conn, process_id):
                 AND g.pais IS NOT NULL
                 AND fv.flete IS NOT NULL
                 AND fv.flete > 0
-            GROUP BY t.anio, t.trimestre, s.sk_shipper, s.nombre_compania, s.telefono,
-                     g.pais, g.region, g.ciudad
+            -- Nombre y teléfono dependen de sk_shipper: se agrupa solo por la clave
+            -- y SQLite los toma de la fila del grupo
+            GROUP BY t.anio, t.trimestre, s.sk_shipper, g.pais, g.region, g.ciudad
+        ),
+        -- El ratio se calcula sobre los totales ya agregados: cada SUM se referencia
+        -- una sola vez, por su alias
+        logistica_ratio AS (
+            SELECT
+                *,
+                CASE
+                    WHEN ventas_totales_asociadas > 0
+                    THEN (costo_flete_total / ventas_totales_asociadas) * 100
+                    ELSE 0
+                END as ratio_flete_vs_ventas
+            FROM logistica_data
         )
-        SELECT 
-            *,
+        SELECT
+            anio, trimestre, sk_shipper, nombre_shipper, telefono_shipper,
+            pais_destino, region_destino, ciudad_destino,
+            envios_realizados, costo_flete_total, costo_flete_promedio,
+            volumen_productos_enviados, ventas_totales_asociadas,
+            ratio_flete_vs_ventas, densidad_poblacion_promedio, pib_promedio_destino,
             RANK() OVER (
                 PARTITION BY anio, trimestre 
                 ORDER BY ratio_flete_vs_ventas ASC
@@ -127,23 +129,25 @@ def create_dp3_analisis_logistica_shippers(conn, process_id):
                 PARTITION BY anio, trimestre 
                 ORDER BY volumen_productos_enviados DESC
             ) as ranking_volumen_trimestre
-        FROM logistica_data
-        ORDER BY anio, trimestre, ranking_eficiencia_costo, volumen_productos_enviados DESC;
+        FROM logistica_ratio;
     """
+    # Control del plan: la agregación debe leer la tabla de hechos por su índice cubriente
+    warn_if_full_scan(conn, insert_query, "fv")
     cursor.execute(insert_query)
     inserted_count = cursor.rowcount
     logging.info(f"{inserted_count} registros de análisis logístico insertados en {table_name}.")
 
+    # El orden de consulta (anio, trimestre, ranking) lo da el índice y no un ORDER BY
+    # sobre toda la tabla en la inserción
+    cursor.execute(DP3_RANKING_INDEX_SQL)
+
     # 3. Registrar el nuevo producto de datos en la metadata
     description = "DP3: Producto de datos que analiza la performance logística de shippers incluyendo costos, volúmenes, eficiencia y rankings por destino geográfico."
-    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     cursor.execute(
-        "INSERT OR REPLACE INTO MET_entidades (nombre_entidad, descripcion, capa, fecha_creacion, usuario_creacion) VALUES (?, ?, ?, ?, ?)",
-        (table_name, description, "DataProduct", current_date, USER),
+        MET_ENTIDAD_UPSERT_SQL, (table_name, description, "DataProduct", USER)
     )
     logging.info(f"Producto de datos {table_name} registrado en la metadata.")
 
-    conn.commit()
     logging.info(f"--- Creación del producto de datos {table_name} finalizada ---")
     return inserted_count
 
@@ -155,24 +159,28 @@ def main():
     logging.info("Iniciando el Paso 10.3: Creación del DP3 - Análisis de Logística y Shippers.")
     conn = None
     process_id = -1
-    start_time = datetime.now()
 
     try:
         conn = sqlite3.connect(DB_PATH)
-        process_id, start_time = log_process_start(
+        process_id = log_process_start(
             conn, "CreacionDP3_AnalisisLogistica", "Genera DP3 para análisis de performance logística y shippers."
         )
 
+        # Reconstrucción del DP y cierre del proceso en una única transacción:
+        # DROP/CREATE fuera de ella se confirmarían de inmediato (autocommit de DDL)
+        conn.execute("BEGIN IMMEDIATE")
         create_dp3_analisis_logistica_shippers(conn, process_id)
 
         log_process_end(
-            conn, process_id, start_time, "Exitoso", "DP3 - Análisis de Logística y Shippers generado."
+            conn, process_id, "Exitoso", "DP3 - Análisis de Logística y Shippers generado."
         )
 
     except sqlite3.Error as e:
         logging.error(f"Error de base de datos en el Paso 10.3: {e}")
+        if conn and conn.in_transaction:
+            conn.rollback()
         if conn and process_id != -1:
-            log_process_end(conn, process_id, start_time, "Fallido", str(e))
+            log_process_end(conn, process_id, "Fallido", str(e))
     finally:
         if conn:
             conn.close()
@@ -0,0 +1,106 @@
+import sqlite3
+import logging
+
+from tp_datawarehousing.steps.step_10_1_ventas_mensuales_categoria_pais import (
+    create_dp1_ventas_mensuales_categoria_pais,
+)
+from tp_datawarehousing.steps.step_10_2_performance_empleados_trimestral import (
+    create_dp2_performance_empleados_trimestral,
+)
+from tp_datawarehousing.steps.step_10_3_analisis_logistica_shippers import (
+    create_dp3_analisis_logistica_shippers,
+)
+from tp_datawarehousing.utils.quality_utils import log_process_start, log_process_end
+
+# --- Configuración de Logging ---
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# --- Constantes ---
+DB_PATH = "db/tp_dwa.db"
+
+# PRAGMAs de la conexión compartida por los tres productos de datos: la caché de
+# páginas queda caliente de una agregación a la siguiente
+DATA_PRODUCT_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",  # 256MB
+    "PRAGMA mmap_size = 268435456",  # 256MB
+)
+
+# Productos de datos en orden de ejecución:
+# (nombre del proceso, comentario de inicio, función de creación, comentario de fin)
+DATA_PRODUCTS = (
+    (
+        "CreacionDP1_VentasMensuales",
+        "Genera DP1 para análisis de ventas por categoría y país.",
+        create_dp1_ventas_mensuales_categoria_pais,
+        "DP1 - Ventas Mensuales por Categoría y País generado.",
+    ),
+    (
+        "CreacionDP2_PerformanceEmpleados",
+        "Genera DP2 para análisis de performance de empleados por trimestre.",
+        create_dp2_performance_empleados_trimestral,
+        "DP2 - Performance de Empleados Trimestral generado.",
+    ),
+    (
+        "CreacionDP3_AnalisisLogistica",
+        "Genera DP3 para análisis de performance logística y shippers.",
+        create_dp3_analisis_logistica_shippers,
+        "DP3 - Análisis de Logística y Shippers generado.",
+    ),
+)
+
+
+def run_all_data_products(conn: sqlite3.Connection):
+    """
+    Genera los tres productos de datos sobre la misma conexión.
+    Cada producto registra su propia ejecución en el DQM y se reconstruye en una
+    única transacción junto con el cierre de su proceso; un error revierte solo ese
+    producto y no impide generar los siguientes.
+    Antes se actualizan una sola vez las estadísticas de DWA_FACT_Ventas, ya con los
+    hechos de Ingesta2, para que el planificador elija los índices cubrientes.
+    """
+    conn.execute("ANALYZE DWA_FACT_Ventas")
+    conn.commit()
+    for process_name, start_comments, create_func, end_comments in DATA_PRODUCTS:
+        process_id = -1
+        try:
+            process_id = log_process_start(conn, process_name, start_comments)
+            conn.execute("BEGIN IMMEDIATE")
+            create_func(conn, process_id)
+            log_process_end(conn, process_id, "Exitoso", end_comments)
+        except sqlite3.Error as e:
+            logging.error(f"Error de base de datos en {process_name}: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            if process_id != -1:
+                log_process_end(conn, process_id, "Fallido", str(e))
+
+
+def main():
+    """
+    Orquesta la creación de los productos de datos DP1, DP2 y DP3 con una única conexión.
+    """
+    logging.info("Iniciando el Paso 10: Creación de los Productos de Datos (DP1, DP2, DP3).")
+    conn = None
+
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        for pragma in DATA_PRODUCT_PRAGMAS:
+            conn.execute(pragma)
+
+        run_all_data_products(conn)
+
+    except sqlite3.Error as e:
+        logging.error(f"Error de base de datos en el Paso 10: {e}")
+    finally:
+        if conn:
+            conn.close()
+            logging.info("Conexión a la base de datos cerrada.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ Módulo enfocado en resolver conflictos detectados en el DQM de forma sistemáti
 
 import sqlite3
 import logging
+import functools
+import pandas as pd
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple, Optional
 from tp_datawarehousing.utils.quality_utils import (
@@ -12,6 +14,7 @@ from tp_datawarehousing.utils.quality_utils import (
     get_process_execution_id, 
     update_process_execution,
     log_quality_metric,
+    log_quality_metrics_batch,
     execute_with_retry
 )
 
@@ -89,6 +92,12 @@ COUNTRY_TO_REGION_MAPPING = {
     "Swaziland": "Africa", "Eswatini": "Africa"
 }
 
+# Claves del mapeo ya en mayúsculas (mismo orden que el dict) para el fuzzy matching
+# por subcadena de infer_region_fallback, sin recalcular upper() en cada comparación
+COUNTRY_TO_REGION_UPPER = tuple(
+    (country.upper(), region) for country, region in COUNTRY_TO_REGION_MAPPING.items()
+)
+
 # 📧 PATRONES DE DATOS DE CONTACTO
 CONTACT_DATA_PATTERNS = {
     "fax_defaults": {
@@ -103,6 +112,96 @@ CONTACT_DATA_PATTERNS = {
     ]
 }
 
+# Métrica NO_ISSUES de cada fase básica: (indicador, entidad, detalle). La registra la
+# propia fase cuando no encuentra problemas, o el orquestador cuando omite la fase
+NO_ISSUES_METRICS = {
+    "scd2": ("SCD2_TEMPORAL_FIX", "DWA_DIM_Clientes", "No se encontraron problemas de lógica temporal"),
+    "region": ("MISSING_REGION_FIX", "TMP2_customers", "No se encontraron clientes sin región"),
+    "shipping": ("MISSING_SHIPPING_FIX", "TMP2_orders", "No se encontraron problemas de datos de envío"),
+}
+
+def log_no_issues_metric(execution_id: int, phase: str, conn: sqlite3.Connection):
+    """Registra y confirma en conn la métrica NO_ISSUES de una fase básica."""
+    nombre_indicador, entidad_asociada, detalles = NO_ISSUES_METRICS[phase]
+    log_quality_metric(
+        execution_id=execution_id,
+        nombre_indicador=nombre_indicador,
+        entidad_asociada=entidad_asociada,
+        resultado="NO_ISSUES",
+        detalles=detalles,
+        conn=conn
+    )
+    conn.commit()
+
+def get_remediation_connection(shared_conn: Optional[sqlite3.Connection] = None) -> sqlite3.Connection:
+    """
+    Devuelve la conexión de una fase de remediación con la transacción de escritura ya
+    tomada (BEGIN IMMEDIATE): la fase lee y luego escribe, y si otro proceso
+    confirmara entre medio su snapshot WAL quedaría invalidado y la escritura
+    fallaría con "database is locked" sin esperar el busy_timeout.
+
+    Si se recibe shared_conn (conexión compartida entre fases) se reutiliza; si no,
+    se abre una conexión nueva.
+    """
+    conn = shared_conn if shared_conn is not None else get_db_connection()
+    if conn is None:
+        raise sqlite3.OperationalError("No se pudo obtener conexión a la base de datos")
+    conn.execute("BEGIN IMMEDIATE")
+    return conn
+
+def release_remediation_connection(conn: sqlite3.Connection, shared_conn: Optional[sqlite3.Connection] = None):
+    """
+    Libera la conexión de una fase. Una conexión propia se cierra; una compartida queda
+    abierta para la fase siguiente, descartando lo no confirmado igual que haría close().
+    """
+    if shared_conn is None:
+        conn.close()
+    elif conn.in_transaction:
+        conn.rollback()
+
+@functools.lru_cache(maxsize=10000)
+def fuzzy_match_region(country: str) -> Optional[str]:
+    """
+    Región del primer país mapeado que contiene a `country` o está contenido en él
+    (comparación en mayúsculas), o None. Depende solo de constantes del módulo, por lo
+    que se cachea entre invocaciones.
+    """
+    country_upper = country.upper()
+    for mapped_upper, region in COUNTRY_TO_REGION_UPPER:
+        if mapped_upper in country_upper or country_upper in mapped_upper:
+            return region
+    return None
+
+def infer_region_fallback(cursor: sqlite3.Cursor, country: str, city: str) -> Tuple[str, str]:
+    """
+    Infiere la región de un país sin mapeo directo en COUNTRY_TO_REGION_MAPPING.
+
+    Returns:
+        Tupla (región inferida, método usado)
+    """
+    # Intento 2: Fuzzy matching contra los países mapeados
+    if country:
+        region = fuzzy_match_region(country)
+        if region:
+            return region, "FUZZY_MATCHING"
+
+    # Intento 3: Usar world_data_2023 como fuente autoritativa
+    cursor.execute("""
+        SELECT country FROM TMP_world_data_2023 
+        WHERE UPPER(country) LIKE ? OR UPPER(largest_city) LIKE ?
+        LIMIT 1
+    """, (f"%{country.upper()}%", f"%{city.upper() if city else ''}%"))
+    world_match = cursor.fetchone()
+    if world_match:
+        return COUNTRY_TO_REGION_MAPPING.get(world_match[0], "Global Region"), "WORLD_DATA_ENRICHMENT"
+
+    # Intento 4: Asignación por defecto inteligente
+    return "International Region", "DEFAULT_ASSIGNMENT"
+
+def build_detail_metrics(entities: pd.Series, details: pd.Series) -> List[tuple]:
+    """Arma las tuplas (entidad, "FIXED", detalle) de log_quality_metrics_batch desde columnas."""
+    return list(zip(entities.tolist(), ["FIXED"] * len(entities), details.tolist()))
+
 class RemediationStats:
     """Clase para trackear estadísticas de remediación EXPANDIDA"""
     def __init__(self):
@@ -124,7 +223,7 @@ class RemediationStats:
                 self.null_geographic_fixes + self.null_contact_fixes + 
                 self.world_data_fixes + self.pattern_based_fixes + self.fuzzy_match_fixes)
 
-def fix_scd2_temporal_logic(execution_id: int) -> RemediationStats:
+def fix_scd2_temporal_logic(execution_id: int, shared_conn: Optional[sqlite3.Connection] = None) -> RemediationStats:
     """
     Corrige problemas de lógica temporal en SCD2 donde fecha_inicio > fecha_fin.
     
@@ -132,6 +231,7 @@ def fix_scd2_temporal_logic(execution_id: int) -> RemediationStats:
     
     Args:
         execution_id: ID de ejecución para logging
+        shared_conn: Conexión compartida entre fases (opcional); si es None se abre una propia
         
     Returns:
         RemediationStats con el número de registros corregidos
@@ -139,7 +239,7 @@ def fix_scd2_temporal_logic(execution_id: int) -> RemediationStats:
     stats = RemediationStats()
     
     def _fix_temporal_logic():
-        conn = get_db_connection()
+        conn = get_remediation_connection(shared_conn)
         try:
             cursor = conn.cursor()
             
@@ -154,42 +254,32 @@ def fix_scd2_temporal_logic(execution_id: int) -> RemediationStats:
             stats.total_issues_detected = len(problematic_records)
             
             if stats.total_issues_detected == 0:
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="SCD2_TEMPORAL_FIX",
-                    entidad_asociada="DWA_DIM_Clientes",
-                    resultado="NO_ISSUES",
-                    detalles="No se encontraron problemas de lógica temporal",
-                    conn=conn
-                )
+                log_no_issues_metric(execution_id, "scd2", conn)
                 return stats
             
-            # Corregir cada registro problemático
-            for record in problematic_records:
-                sk_cliente, nk_cliente_id, fecha_inicio, fecha_fin = record
-                
+            # Calcular la corrección de cada registro problemático
+            updates = []
+            detail_metrics = []
+            for sk_cliente, nk_cliente_id, fecha_inicio, fecha_fin in problematic_records:
                 # Calcular nueva fecha_fin = fecha_inicio + 1 día
                 fecha_inicio_dt = datetime.strptime(fecha_inicio, "%Y-%m-%d")
                 nueva_fecha_fin = (fecha_inicio_dt + timedelta(days=1)).strftime("%Y-%m-%d")
                 
-                # Actualizar el registro
-                cursor.execute("""
-                    UPDATE DWA_DIM_Clientes 
-                    SET fecha_fin_validez = ?
-                    WHERE sk_cliente = ?
-                """, (nueva_fecha_fin, sk_cliente))
-                
-                stats.scd2_fixes += 1
-                
-                # Log individual del fix
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="SCD2_TEMPORAL_FIX_DETAIL",
-                    entidad_asociada=f"DWA_DIM_Clientes.{nk_cliente_id}",
-                    resultado="FIXED",
-                    detalles=f"Fecha fin corregida: {fecha_fin} → {nueva_fecha_fin}",
-                    conn=conn
-                )
+                updates.append((nueva_fecha_fin, sk_cliente))
+                detail_metrics.append((
+                    f"DWA_DIM_Clientes.{nk_cliente_id}",
+                    "FIXED",
+                    f"Fecha fin corregida: {fecha_fin} → {nueva_fecha_fin}"
+                ))
+            
+            # Aplicar todas las correcciones y sus métricas de detalle en lote
+            cursor.executemany("""
+                UPDATE DWA_DIM_Clientes 
+                SET fecha_fin_validez = ?
+                WHERE sk_cliente = ?
+            """, updates)
+            stats.scd2_fixes += len(updates)
+            log_quality_metrics_batch(execution_id, "SCD2_TEMPORAL_FIX_DETAIL", detail_metrics, conn)
             
             conn.commit()
             stats.total_issues_resolved = stats.scd2_fixes
@@ -208,7 +298,7 @@ def fix_scd2_temporal_logic(execution_id: int) -> RemediationStats:
             return stats
             
         finally:
-            conn.close()
+            release_remediation_connection(conn, shared_conn)
     
     try:
         return execute_with_retry(_fix_temporal_logic)
@@ -223,7 +313,7 @@ def fix_scd2_temporal_logic(execution_id: int) -> RemediationStats:
         )
         return stats
 
-def resolve_missing_regions(execution_id: int) -> RemediationStats:
+def resolve_missing_regions(execution_id: int, shared_conn: Optional[sqlite3.Connection] = None) -> RemediationStats:
     """
     Resuelve regiones faltantes usando mapeo país → región por defecto.
     
@@ -233,6 +323,7 @@ def resolve_missing_regions(execution_id: int) -> RemediationStats:
     
     Args:
         execution_id: ID de ejecución para logging
+        shared_conn: Conexión compartida entre fases (opcional); si es None se abre una propia
         
     Returns:
         RemediationStats con el número de registros corregidos
@@ -240,7 +331,7 @@ def resolve_missing_regions(execution_id: int) -> RemediationStats:
     stats = RemediationStats()
     
     def _resolve_regions():
-        conn = get_db_connection()
+        conn = get_remediation_connection(shared_conn)
         try:
             cursor = conn.cursor()
             
@@ -255,14 +346,7 @@ def resolve_missing_regions(execution_id: int) -> RemediationStats:
             stats.total_issues_detected = len(customers_without_region)
             
             if stats.total_issues_detected == 0:
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="MISSING_REGION_FIX",
-                    entidad_asociada="TMP2_customers",
-                    resultado="NO_ISSUES",
-                    detalles="No se encontraron clientes sin región",
-                    conn=conn
-                )
+                log_no_issues_metric(execution_id, "region", conn)
                 return stats
             
             # Resolver región para cada cliente
@@ -313,7 +397,7 @@ def resolve_missing_regions(execution_id: int) -> RemediationStats:
             return stats
             
         finally:
-            conn.close()
+            release_remediation_connection(conn, shared_conn)
     
     try:
         return execute_with_retry(_resolve_regions)
@@ -328,7 +412,7 @@ def resolve_missing_regions(execution_id: int) -> RemediationStats:
         )
         return stats
 
-def handle_missing_shipping_data(execution_id: int) -> RemediationStats:
+def handle_missing_shipping_data(execution_id: int, shared_conn: Optional[sqlite3.Connection] = None) -> RemediationStats:
     """
     Maneja datos de envío faltantes en órdenes.
     
@@ -339,6 +423,7 @@ def handle_missing_shipping_data(execution_id: int) -> RemediationStats:
     
     Args:
         execution_id: ID de ejecución para logging
+        shared_conn: Conexión compartida entre fases (opcional); si es None se abre una propia
         
     Returns:
         RemediationStats con el número de registros corregidos
@@ -346,7 +431,7 @@ def handle_missing_shipping_data(execution_id: int) -> RemediationStats:
     stats = RemediationStats()
     
     def _handle_shipping_data():
-        conn = get_db_connection()
+        conn = get_remediation_connection(shared_conn)
         try:
             cursor = conn.cursor()
             
@@ -363,14 +448,7 @@ def handle_missing_shipping_data(execution_id: int) -> RemediationStats:
             stats.total_issues_detected = len(orders_with_issues)
             
             if stats.total_issues_detected == 0:
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="MISSING_SHIPPING_FIX",
-                    entidad_asociada="TMP2_orders",
-                    resultado="NO_ISSUES", 
-                    detalles="No se encontraron problemas de datos de envío",
-                    conn=conn
-                )
+                log_no_issues_metric(execution_id, "shipping", conn)
                 return stats
             
             region_fixes = 0
@@ -435,7 +513,7 @@ def handle_missing_shipping_data(execution_id: int) -> RemediationStats:
             return stats
             
         finally:
-            conn.close()
+            release_remediation_connection(conn, shared_conn)
     
     try:
         return execute_with_retry(_handle_shipping_data) 
@@ -452,7 +530,7 @@ def handle_missing_shipping_data(execution_id: int) -> RemediationStats:
 
 # 🚀 ================ NUEVAS FUNCIONES DE REMEDIACIÓN AVANZADA ================
 
-def advanced_geographic_remediation(execution_id: int) -> RemediationStats:
+def advanced_geographic_remediation(execution_id: int, shared_conn: Optional[sqlite3.Connection] = None) -> RemediationStats:
     """
     🌍 MOTOR DE REMEDIACIÓN GEOGRÁFICA AVANZADO
     
@@ -464,6 +542,7 @@ def advanced_geographic_remediation(execution_id: int) -> RemediationStats:
     
     Args:
         execution_id: ID de ejecución para logging
+        shared_conn: Conexión compartida entre fases (opcional); si es None se abre una propia
         
     Returns:
         RemediationStats con estadísticas detalladas
@@ -471,7 +550,7 @@ def advanced_geographic_remediation(execution_id: int) -> RemediationStats:
     stats = RemediationStats()
     
     def _advanced_geographic_fix():
-        conn = get_db_connection()
+        conn = get_remediation_connection(shared_conn)
         try:
             cursor = conn.cursor()
             
@@ -491,127 +570,92 @@ def advanced_geographic_remediation(execution_id: int) -> RemediationStats:
             """)
             
             # === FASE 2: REMEDIAR TMP_customers.region (60 nulos de 91) ===
-            cursor.execute("""
+            # Las fases 2-4 operan sobre DataFrames: el mapeo país → región se aplica
+            # por columna y cada tabla se actualiza con un único executemany.
+            customers = pd.read_sql_query("""
                 SELECT customer_id, country, city 
                 FROM TMP_customers 
                 WHERE region IS NULL OR region = ''
-            """)
-            customers_without_region = cursor.fetchall()
-            
-            logging.info(f"🔍 Encontrados {len(customers_without_region)} clientes sin región en TMP_customers")
-            
-            for customer_id, country, city in customers_without_region:
-                # Intento 1: Mapeo directo usando diccionario expandido
-                inferred_region = COUNTRY_TO_REGION_MAPPING.get(country)
-                method_used = "DIRECT_MAPPING"
-                
-                # Intento 2: Fuzzy matching si no hay mapeo directo
-                if not inferred_region and country:
-                    country_upper = country.upper()
-                    for mapped_country, region in COUNTRY_TO_REGION_MAPPING.items():
-                        if (mapped_country.upper() in country_upper or 
-                            country_upper in mapped_country.upper()):
-                            inferred_region = region
-                            method_used = "FUZZY_MATCHING"
-                            stats.fuzzy_match_fixes += 1
-                            break
-                
-                # Intento 3: Usar world_data_2023 como fuente autoritativa
-                if not inferred_region:
-                    cursor.execute("""
-                        SELECT country FROM TMP_world_data_2023 
-                        WHERE UPPER(country) LIKE ? OR UPPER(largest_city) LIKE ?
-                        LIMIT 1
-                    """, (f"%{country.upper()}%", f"%{city.upper() if city else ''}%"))
-                    
-                    world_match = cursor.fetchone()
-                    if world_match:
-                        world_country = world_match[0]
-                        inferred_region = COUNTRY_TO_REGION_MAPPING.get(world_country, "Global Region")
-                        method_used = "WORLD_DATA_ENRICHMENT"
-                        stats.world_data_fixes += 1
-                
-                # Intento 4: Asignación por defecto inteligente
-                if not inferred_region:
-                    inferred_region = "International Region"
-                    method_used = "DEFAULT_ASSIGNMENT"
-                
-                # Aplicar la corrección
-                cursor.execute("""
-                    UPDATE TMP_customers 
-                    SET region = ? 
-                    WHERE customer_id = ?
-                """, (inferred_region, customer_id))
-                
-                stats.null_geographic_fixes += 1
-                
-                # Log detallado del fix
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="ADVANCED_GEOGRAPHIC_FIX_DETAIL",
-                    entidad_asociada=f"TMP_customers.{customer_id}",
-                    resultado="FIXED",
-                    detalles=f"Country: {country} → Region: {inferred_region} (Method: {method_used})",
-                    conn=conn
-                )
+            """, conn)
+            
+            logging.info(f"🔍 Encontrados {len(customers)} clientes sin región en TMP_customers")
+            
+            # Intento 1: Mapeo directo usando diccionario expandido
+            region = customers["country"].map(COUNTRY_TO_REGION_MAPPING).astype(object)
+            method = pd.Series("DIRECT_MAPPING", index=customers.index, dtype=object)
+            
+            # Intentos 2-4 solo para los países sin mapeo directo, una vez por cada par
+            # (país, ciudad) distinto; el resultado se asigna a todas sus filas
+            unmapped = region.isna()
+            lookup_keys = list(zip(
+                customers.loc[unmapped, "country"].fillna(""),
+                customers.loc[unmapped, "city"].fillna(""),
+            ))
+            fallback_by_key = {
+                key: infer_region_fallback(cursor, *key) for key in dict.fromkeys(lookup_keys)
+            }
+            fallback = [fallback_by_key[key] for key in lookup_keys]
+            if fallback:
+                fallback_methods = [used for _, used in fallback]
+                region.loc[unmapped] = [inferred for inferred, _ in fallback]
+                method.loc[unmapped] = fallback_methods
+                stats.fuzzy_match_fixes += fallback_methods.count("FUZZY_MATCHING")
+                stats.world_data_fixes += fallback_methods.count("WORLD_DATA_ENRICHMENT")
+            
+            cursor.executemany("""
+                UPDATE TMP_customers 
+                SET region = ? 
+                WHERE customer_id = ?
+            """, list(zip(region.tolist(), customers["customer_id"].tolist())))
+            stats.null_geographic_fixes += len(customers)
+            
+            # Métricas de detalle de todas las fases, registradas en lote al final
+            detail_metrics = build_detail_metrics(
+                "TMP_customers." + customers["customer_id"].astype(str),
+                "Country: " + customers["country"].fillna("None") + " → Region: " + region
+                + " (Method: " + method + ")"
+            )
             
             # === FASE 3: REMEDIAR TMP_suppliers.region (20 nulos de 29) ===
-            cursor.execute("""
+            suppliers = pd.read_sql_query("""
                 SELECT supplier_id, country, city 
                 FROM TMP_suppliers 
                 WHERE region IS NULL OR region = ''
-            """)
-            suppliers_without_region = cursor.fetchall()
-            
-            logging.info(f"🔍 Encontrados {len(suppliers_without_region)} suppliers sin región en TMP_suppliers")
-            
-            for supplier_id, country, city in suppliers_without_region:
-                inferred_region = COUNTRY_TO_REGION_MAPPING.get(country, "Business Region")
-                
-                cursor.execute("""
-                    UPDATE TMP_suppliers 
-                    SET region = ? 
-                    WHERE supplier_id = ?
-                """, (inferred_region, supplier_id))
-                
-                stats.null_geographic_fixes += 1
-                
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="ADVANCED_GEOGRAPHIC_FIX_DETAIL",
-                    entidad_asociada=f"TMP_suppliers.{supplier_id}",
-                    resultado="FIXED",
-                    detalles=f"Supplier region inferred: {country} → {inferred_region}",
-                    conn=conn
-                )
+            """, conn)
+            
+            logging.info(f"🔍 Encontrados {len(suppliers)} suppliers sin región en TMP_suppliers")
+            
+            supplier_region = suppliers["country"].map(COUNTRY_TO_REGION_MAPPING).fillna("Business Region")
+            cursor.executemany("""
+                UPDATE TMP_suppliers 
+                SET region = ? 
+                WHERE supplier_id = ?
+            """, list(zip(supplier_region.tolist(), suppliers["supplier_id"].tolist())))
+            stats.null_geographic_fixes += len(suppliers)
+            detail_metrics += build_detail_metrics(
+                "TMP_suppliers." + suppliers["supplier_id"].astype(str),
+                "Supplier region inferred: " + suppliers["country"].fillna("None") + " → " + supplier_region
+            )
             
             # === FASE 4: REMEDIAR TMP_employees.region (4 nulos de 9) ===
-            cursor.execute("""
+            employees = pd.read_sql_query("""
                 SELECT employee_id, country, city 
                 FROM TMP_employees 
                 WHERE region IS NULL OR region = ''
-            """)
-            employees_without_region = cursor.fetchall()
-            
-            for employee_id, country, city in employees_without_region:
-                inferred_region = COUNTRY_TO_REGION_MAPPING.get(country, "Corporate Region")
-                
-                cursor.execute("""
-                    UPDATE TMP_employees 
-                    SET region = ? 
-                    WHERE employee_id = ?
-                """, (inferred_region, employee_id))
-                
-                stats.null_geographic_fixes += 1
-                
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="ADVANCED_GEOGRAPHIC_FIX_DETAIL",
-                    entidad_asociada=f"TMP_employees.{employee_id}",
-                    resultado="FIXED",
-                    detalles=f"Employee region inferred: {country} → {inferred_region}",
-                    conn=conn
-                )
+            """, conn)
+            
+            employee_region = employees["country"].map(COUNTRY_TO_REGION_MAPPING).fillna("Corporate Region")
+            cursor.executemany("""
+                UPDATE TMP_employees 
+                SET region = ? 
+                WHERE employee_id = ?
+            """, list(zip(employee_region.tolist(), employees["employee_id"].tolist())))
+            stats.null_geographic_fixes += len(employees)
+            detail_metrics += build_detail_metrics(
+                "TMP_employees." + employees["employee_id"].astype(str),
+                "Employee region inferred: " + employees["country"].fillna("None") + " → " + employee_region
+            )
+            log_quality_metrics_batch(execution_id, "ADVANCED_GEOGRAPHIC_FIX_DETAIL", detail_metrics, conn)
             
             # === FASE 5: PROPAGACIÓN INTELIGENTE PARA SHIP_REGIONS ===
             # Remediar los 507 nulos en TMP_orders.ship_region usando customer region
@@ -649,7 +693,7 @@ def advanced_geographic_remediation(execution_id: int) -> RemediationStats:
             return stats
             
         finally:
-            conn.close()
+            release_remediation_connection(conn, shared_conn)
     
     try:
         return execute_with_retry(_advanced_geographic_fix)
@@ -657,7 +701,7 @@ def advanced_geographic_remediation(execution_id: int) -> RemediationStats:
         logging.error(f"Error en advanced_geographic_remediation: {e}")
         return stats
 
-def advanced_contact_data_remediation(execution_id: int) -> RemediationStats:
+def advanced_contact_data_remediation(execution_id: int, shared_conn: Optional[sqlite3.Connection] = None) -> RemediationStats:
     """
     📧 REMEDIACIÓN AVANZADA DE DATOS DE CONTACTO
     
@@ -668,6 +712,7 @@ def advanced_contact_data_remediation(execution_id: int) -> RemediationStats:
     
     Args:
         execution_id: ID de ejecución para logging
+        shared_conn: Conexión compartida entre fases (opcional); si es None se abre una propia
         
     Returns:
         RemediationStats con estadísticas de contacto
@@ -675,100 +720,94 @@ def advanced_contact_data_remediation(execution_id: int) -> RemediationStats:
     stats = RemediationStats()
     
     def _contact_data_fix():
-        conn = get_db_connection()
+        conn = get_remediation_connection(shared_conn)
         try:
             cursor = conn.cursor()
             
             # === FASE 1: GENERAR FAXES PARA SUPPLIERS (16 nulos de 29) ===
-            cursor.execute("""
+            suppliers_without_fax = pd.read_sql_query("""
                 SELECT supplier_id, company_name, country 
                 FROM TMP_suppliers 
                 WHERE fax IS NULL OR fax = ''
-            """)
-            suppliers_without_fax = cursor.fetchall()
+            """, conn)
             
-            for supplier_id, company_name, country in suppliers_without_fax:
-                # Generar fax pattern basado en país
-                fax_pattern = CONTACT_DATA_PATTERNS["fax_defaults"].get(country, "+XX-XXX-XXXXXXX")
-                generated_fax = f"{fax_pattern} (Generated)"
-                
-                cursor.execute("""
-                    UPDATE TMP_suppliers 
-                    SET fax = ? 
-                    WHERE supplier_id = ?
-                """, (generated_fax, supplier_id))
-                
-                stats.null_contact_fixes += 1
-                
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="CONTACT_DATA_FIX_DETAIL",
-                    entidad_asociada=f"TMP_suppliers.{supplier_id}",
-                    resultado="FIXED",
-                    detalles=f"Generated fax pattern for {country}: {generated_fax}",
-                    conn=conn
-                )
+            # Generar fax pattern basado en país
+            fax_defaults = CONTACT_DATA_PATTERNS["fax_defaults"]
+            generated_fax = (
+                suppliers_without_fax["country"].map(fax_defaults).fillna("+XX-XXX-XXXXXXX")
+                + " (Generated)"
+            )
+            cursor.executemany("""
+                UPDATE TMP_suppliers 
+                SET fax = ? 
+                WHERE supplier_id = ?
+            """, list(zip(generated_fax.tolist(), suppliers_without_fax["supplier_id"].tolist())))
+            stats.null_contact_fixes += len(suppliers_without_fax)
+            
+            # Métricas de detalle de todas las fases, registradas en lote al final
+            detail_metrics = build_detail_metrics(
+                "TMP_suppliers." + suppliers_without_fax["supplier_id"].astype(str),
+                "Generated fax pattern for " + suppliers_without_fax["country"].fillna("None")
+                + ": " + generated_fax
+            )
             
             # === FASE 2: GENERAR HOME_PAGES PARA SUPPLIERS (24 nulos de 29) ===
-            cursor.execute("""
+            suppliers_without_homepage = pd.read_sql_query("""
                 SELECT supplier_id, company_name, country 
                 FROM TMP_suppliers 
                 WHERE home_page IS NULL OR home_page = ''
-            """)
-            suppliers_without_homepage = cursor.fetchall()
+            """, conn)
             
             import random
-            for supplier_id, company_name, country in suppliers_without_homepage:
-                # Generar URL basada en company name y dominio de negocio
-                clean_name = company_name.lower().replace(' ', '').replace('&', 'and').replace('.', '')[:15] if company_name else f"supplier{supplier_id}"
-                domain = random.choice(CONTACT_DATA_PATTERNS["business_domains"])
-                generated_url = f"http://www.{clean_name}.{domain}"
-                
-                cursor.execute("""
-                    UPDATE TMP_suppliers 
-                    SET home_page = ? 
-                    WHERE supplier_id = ?
-                """, (generated_url, supplier_id))
-                
-                stats.null_contact_fixes += 1
-                
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="CONTACT_DATA_FIX_DETAIL", 
-                    entidad_asociada=f"TMP_suppliers.{supplier_id}",
-                    resultado="FIXED",
-                    detalles=f"Generated homepage: {generated_url}",
-                    conn=conn
-                )
+            # Generar URL basada en company name y dominio de negocio
+            company_name = suppliers_without_homepage["company_name"]
+            clean_name = (
+                company_name.str.lower()
+                .str.replace(' ', '', regex=False)
+                .str.replace('&', 'and', regex=False)
+                .str.replace('.', '', regex=False)
+                .str[:15]
+                .where(company_name.fillna("") != "", "supplier" + suppliers_without_homepage["supplier_id"].astype(str))
+            )
+            # Un random.choice por fila, en el mismo orden que las filas
+            domain = [
+                random.choice(CONTACT_DATA_PATTERNS["business_domains"])
+                for _ in range(len(suppliers_without_homepage))
+            ]
+            generated_url = "http://www." + clean_name + "." + pd.Series(domain, index=clean_name.index, dtype=object)
+            cursor.executemany("""
+                UPDATE TMP_suppliers 
+                SET home_page = ? 
+                WHERE supplier_id = ?
+            """, list(zip(generated_url.tolist(), suppliers_without_homepage["supplier_id"].tolist())))
+            stats.null_contact_fixes += len(suppliers_without_homepage)
+            detail_metrics += build_detail_metrics(
+                "TMP_suppliers." + suppliers_without_homepage["supplier_id"].astype(str),
+                "Generated homepage: " + generated_url
+            )
             
             # === FASE 3: GENERAR FAXES PARA CUSTOMERS (22 nulos de 91) ===
-            cursor.execute("""
+            customers_without_fax = pd.read_sql_query("""
                 SELECT customer_id, company_name, country 
                 FROM TMP_customers 
                 WHERE fax IS NULL OR fax = ''
-            """)
-            customers_without_fax = cursor.fetchall()
+            """, conn)
             
-            for customer_id, company_name, country in customers_without_fax:
-                fax_pattern = CONTACT_DATA_PATTERNS["fax_defaults"].get(country, "+XX-XXX-XXXXXXX")
-                generated_fax = f"{fax_pattern} (Auto-generated)"
-                
-                cursor.execute("""
-                    UPDATE TMP_customers 
-                    SET fax = ? 
-                    WHERE customer_id = ?
-                """, (generated_fax, customer_id))
-                
-                stats.null_contact_fixes += 1
-                
-                log_quality_metric(
-                    execution_id=execution_id,
-                    nombre_indicador="CONTACT_DATA_FIX_DETAIL",
-                    entidad_asociada=f"TMP_customers.{customer_id}",
-                    resultado="FIXED", 
-                    detalles=f"Generated customer fax: {generated_fax}",
-                    conn=conn
-                )
+            generated_customer_fax = (
+                customers_without_fax["country"].map(fax_defaults).fillna("+XX-XXX-XXXXXXX")
+                + " (Auto-generated)"
+            )
+            cursor.executemany("""
+                UPDATE TMP_customers 
+                SET fax = ? 
+                WHERE customer_id = ?
+            """, list(zip(generated_customer_fax.tolist(), customers_without_fax["customer_id"].tolist())))
+            stats.null_contact_fixes += len(customers_without_fax)
+            detail_metrics += build_detail_metrics(
+                "TMP_customers." + customers_without_fax["customer_id"].astype(str),
+                "Generated customer fax: " + generated_customer_fax
+            )
+            log_quality_metrics_batch(execution_id, "CONTACT_DATA_FIX_DETAIL", detail_metrics, conn)
             
             conn.commit()
             stats.total_issues_resolved = stats.null_contact_fixes
@@ -787,7 +826,7 @@ def advanced_contact_data_remediation(execution_id: int) -> RemediationStats:
             return stats
             
         finally:
-            conn.close()
+            release_remediation_connection(conn, shared_conn)
     
     try:
         return execute_with_retry(_contact_data_fix)
@@ -795,7 +834,7 @@ def advanced_contact_data_remediation(execution_id: int) -> RemediationStats:
         logging.error(f"Error en advanced_contact_data_remediation: {e}")
         return stats
 
-def world_data_enrichment_remediation(execution_id: int) -> RemediationStats:
+def world_data_enrichment_remediation(execution_id: int, shared_conn: Optional[sqlite3.Connection] = None) -> RemediationStats:
     """
     🌎 REMEDIACIÓN DE WORLD DATA USANDO PATRONES ESTADÍSTICOS
     
@@ -804,7 +843,7 @@ def world_data_enrichment_remediation(execution_id: int) -> RemediationStats:
     stats = RemediationStats()
     
     def _world_data_fix():
-        conn = get_db_connection()
+        conn = get_remediation_connection(shared_conn)
         try:
             cursor = conn.cursor()
             
@@ -838,7 +877,7 @@ def world_data_enrichment_remediation(execution_id: int) -> RemediationStats:
             return stats
             
         finally:
-            conn.close()
+            release_remediation_connection(conn, shared_conn)
     
     try:
         return execute_with_retry(_world_data_fix)
@@ -863,7 +902,8 @@ def create_remediation_report(execution_id: int, scd2_stats: RemediationStats,
         world_data_stats: Estadísticas de enriquecimiento world data
         
     Returns:
-        Dict con el reporte consolidado CORREGIDO
+        Dict con el reporte consolidado CORREGIDO. Si no se aplicó ninguna corrección
+        el reporte tiene estado NO_ISSUES y no se registra en el DQM.
     """
     # === MÉTRICAS CORREGIDAS ===
     
@@ -906,7 +946,13 @@ def create_remediation_report(execution_id: int, scd2_stats: RemediationStats,
     # Estimamos que tenemos ~6 categorías principales de problemas
     total_problem_categories = 6  # SCD2, Regiones, Shipping, Geographic, Contact, World Data
     
-    resolution_rate = (total_problem_categories_resolved / total_problem_categories * 100) if total_problem_categories > 0 else 0
+    if total_fixes_applied == 0:
+        # Sin correcciones no hay categorías pendientes de resolver
+        resolution_rate = 100
+        status = "NO_ISSUES"
+    else:
+        resolution_rate = (total_problem_categories_resolved / total_problem_categories * 100) if total_problem_categories > 0 else 0
+        status = "SUCCESS" if resolution_rate >= 83 else "PARTIAL_SUCCESS" if resolution_rate >= 50 else "FAILED"  # 83% = 5/6 categorías
     
     # 5. MÉTRICAS ADICIONALES PARA ANÁLISIS
     data_quality_improvement_score = (total_fixes_applied / 181 * 100)  # Cuántos fixes vs problemas originales
@@ -919,7 +965,7 @@ def create_remediation_report(execution_id: int, scd2_stats: RemediationStats,
             "problem_categories_total": total_problem_categories,
             "problem_categories_resolved": total_problem_categories_resolved,
             "resolution_rate_percent": round(resolution_rate, 1),
-            "status": "SUCCESS" if resolution_rate >= 83 else "PARTIAL_SUCCESS" if resolution_rate >= 50 else "FAILED",  # 83% = 5/6 categorías
+            "status": status,
             
             # MÉTRICAS OPERACIONALES
             "total_fixes_applied": total_fixes_applied,
@@ -951,6 +997,10 @@ def create_remediation_report(execution_id: int, scd2_stats: RemediationStats,
         }
     }
     
+    # Una ejecución sin cambios no deja reporte en el DQM
+    if total_fixes_applied == 0:
+        return report
+    
     # Log del reporte final
     log_quality_metric(
         execution_id=execution_id,
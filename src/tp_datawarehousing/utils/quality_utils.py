@@ -9,6 +9,7 @@ import time
 import random
 import re
 import json
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Any, Dict, List, Union
 from enum import Enum
@@ -23,6 +24,7 @@ MAX_CONNECTION_TIMEOUT = 30.0  # Timeout reducido para detectar problemas más r
 BATCH_SIZE = 50  # Reducir batch size para menos contención
 WAL_CHECKPOINT_INTERVAL = 500  # Checkpoint WAL más frecuente
 CONNECTION_POOL_SIZE = 3  # Pool de conexiones limitado
+STATEMENT_CACHE_SIZE = 512  # Sentencias compiladas que cachea cada conexión (cached_statements)
 
 # --- Enums para niveles de severidad y calidad ---
 class QualitySeverity(Enum):
@@ -159,7 +161,9 @@ def get_db_connection(timeout=None):
     """
     try:
         connection_timeout = timeout or MAX_CONNECTION_TIMEOUT
-        conn = sqlite3.connect(DB_PATH, timeout=connection_timeout)
+        conn = sqlite3.connect(
+            DB_PATH, timeout=connection_timeout, cached_statements=STATEMENT_CACHE_SIZE
+        )
 
         # Configuración optimizada para máxima concurrencia y estabilidad
         conn.execute("PRAGMA busy_timeout=30000")  # 30 segundos de timeout (reducido)
@@ -277,6 +281,116 @@ def update_process_execution(
         logging.error(f"Error actualizando ejecución: {e}")
 
 
+# SQL constante del inicio/fin de proceso sobre una conexión del llamador: se
+# reutiliza la sentencia preparada en cada producto de datos. Las fechas (hora
+# local, como el resto del DQM) y la duración las calcula SQLite
+PROCESS_START_SQL = """
+    INSERT INTO DQM_ejecucion_procesos (nombre_proceso, fecha_inicio, estado, comentarios)
+    VALUES (?, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'), ?, ?)
+"""
+
+PROCESS_END_SQL = """
+    UPDATE DQM_ejecucion_procesos
+    SET fecha_fin = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'),
+        estado = ?,
+        duracion_seg = ROUND((julianday('now', 'localtime') - julianday(fecha_inicio)) * 86400, 3),
+        comentarios = ?
+    WHERE id_ejecucion = ?
+"""
+
+
+# Alta o actualización de una entidad en MET_entidades. ON CONFLICT DO UPDATE
+# modifica la fila existente en lugar de borrarla y reinsertarla (INSERT OR REPLACE)
+MET_ENTIDAD_UPSERT_SQL = """
+    INSERT INTO MET_entidades (nombre_entidad, descripcion, capa, fecha_creacion, usuario_creacion)
+    VALUES (?, ?, ?, datetime('now', 'localtime'), ?)
+    ON CONFLICT (nombre_entidad) DO UPDATE SET
+        descripcion = excluded.descripcion,
+        capa = excluded.capa,
+        fecha_creacion = excluded.fecha_creacion,
+        usuario_creacion = excluded.usuario_creacion
+"""
+
+
+def warn_if_full_scan(conn: sqlite3.Connection, query: str, table_alias: str) -> bool:
+    """
+    Revisa el plan de la consulta (EXPLAIN QUERY PLAN) y advierte si recorre la
+    tabla con alias table_alias completa, sin índice. Detecta en ejecución que el
+    planificador dejó de usar el índice que la consulta asume.
+
+    Returns:
+        True si el plan accede a la tabla por índice
+    """
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+    if f"SCAN {table_alias}" in plan:
+        logging.warning(
+            f"El plan recorre '{table_alias}' completa sin índice: " + " | ".join(plan)
+        )
+        return False
+    return True
+
+
+def log_process_start(conn: sqlite3.Connection, process_name: str, comments: str = "") -> int:
+    """
+    Registra el inicio de un proceso en DQM_ejecucion_procesos usando la conexión
+    recibida y lo confirma de inmediato.
+
+    Returns:
+        ID de ejecución del proceso
+    """
+    cursor = conn.execute(PROCESS_START_SQL, (process_name, "En Progreso", comments))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def log_process_end(conn: sqlite3.Connection, process_id: int, status: str, comments: str = ""):
+    """
+    Registra el fin de un proceso (estado y duración) usando la conexión recibida.
+    El commit confirma también la transacción en curso del llamador.
+    """
+    conn.execute(PROCESS_END_SQL, (status, comments, process_id))
+    conn.commit()
+
+
+# SQL constante del registro de métricas: se reutiliza la sentencia preparada
+QUALITY_METRIC_INSERT_SQL = """
+    INSERT INTO DQM_indicadores_calidad 
+    (id_ejecucion, nombre_indicador, entidad_asociada, resultado, detalles)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+# Conexión reutilizable para registrar métricas, una por hilo
+# (sqlite3 no permite compartir una conexión entre hilos)
+_metric_connections = threading.local()
+
+
+def get_metric_connection() -> sqlite3.Connection:
+    """
+    Devuelve la conexión del hilo actual usada para registrar métricas de calidad,
+    creándola la primera vez. Evita abrir y configurar una conexión por métrica.
+
+    Returns:
+        Conexión SQLite configurada
+    """
+    conn = getattr(_metric_connections, "conn", None)
+    if conn is None:
+        conn = get_db_connection()
+        if conn is None:
+            raise sqlite3.OperationalError("No se pudo obtener conexión para métricas")
+        _metric_connections.conn = conn
+    return conn
+
+
+def close_metric_connection():
+    """
+    Cierra la conexión de métricas del hilo actual, si existe.
+    """
+    conn = getattr(_metric_connections, "conn", None)
+    if conn is not None:
+        conn.close()
+        _metric_connections.conn = None
+
+
 def log_quality_metric(
     execution_id: int,
     nombre_indicador: str,
@@ -300,34 +414,21 @@ def log_quality_metric(
     """
 
     def _log_metric():
+        params = (execution_id, nombre_indicador, entidad_asociada, resultado, detalles)
         if conn is not None:
             # Usar conexión existente
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO DQM_indicadores_calidad 
-                (id_ejecucion, nombre_indicador, entidad_asociada, resultado, detalles)
-                VALUES (?, ?, ?, ?, ?)
-            """,
-                (execution_id, nombre_indicador, entidad_asociada, resultado, detalles),
-            )
+            conn.execute(QUALITY_METRIC_INSERT_SQL, params)
             # No hacer commit aquí - lo hará el proceso principal
         else:
-            # Crear nueva conexión (comportamiento original)
-            new_conn = get_db_connection()
+            # Reutilizar la conexión de métricas del hilo y confirmar de inmediato
+            metric_conn = get_metric_connection()
             try:
-                cursor = new_conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO DQM_indicadores_calidad 
-                    (id_ejecucion, nombre_indicador, entidad_asociada, resultado, detalles)
-                    VALUES (?, ?, ?, ?, ?)
-                """,
-                    (execution_id, nombre_indicador, entidad_asociada, resultado, detalles),
-                )
-                new_conn.commit()
-            finally:
-                new_conn.close()
+                metric_conn.execute(QUALITY_METRIC_INSERT_SQL, params)
+                metric_conn.commit()
+            except Exception:
+                # No dejar una transacción abierta en la conexión compartida
+                metric_conn.rollback()
+                raise
 
     try:
         if conn is not None:
@@ -343,6 +444,39 @@ def log_quality_metric(
         logging.error(f"Error registrando métrica de calidad: {e}")
 
 
+def log_quality_metrics_batch(
+    execution_id: int,
+    nombre_indicador: str,
+    metrics: List[tuple],
+    conn: sqlite3.Connection,
+):
+    """
+    Registra en lote varias métricas de un mismo indicador con un único executemany.
+    Pensado para métricas de detalle por registro; no hace commit, lo hará el proceso principal.
+
+    Args:
+        execution_id: ID de ejecución del proceso
+        nombre_indicador: Nombre del indicador de calidad
+        metrics: Lista de tuplas (entidad_asociada, resultado, detalles)
+        conn: Conexión con la transacción en curso
+    """
+    if not metrics:
+        return
+    try:
+        conn.executemany(
+            QUALITY_METRIC_INSERT_SQL,
+            [
+                (execution_id, nombre_indicador, entidad, resultado, detalles)
+                for entidad, resultado, detalles in metrics
+            ],
+        )
+        logging.info(
+            f"Métricas de calidad registradas: {nombre_indicador} - {len(metrics)} registros"
+        )
+    except sqlite3.Error as e:
+        logging.error(f"Error registrando métricas de calidad: {e}")
+
+
 def validate_table_count(
     execution_id: int,
     table_name: str,
@@ -714,7 +848,7 @@ def log_record_count(execution_id: int, operation: str, table_name: str, count:
     )
 
 
-def execute_transaction_with_retry(transaction_func, *args, **kwargs):
+def execute_transaction_with_retry(transaction_func, *args, shared_conn=None, **kwargs):
     """
     Ejecuta una transacción completa con reintentos automáticos.
     Maneja commits y rollbacks de manera segura.
@@ -722,6 +856,8 @@ def execute_transaction_with_retry(transaction_func, *args, **kwargs):
     Args:
         transaction_func: Función que contiene la lógica de transacción
         *args, **kwargs: Argumentos para la función
+        shared_conn: Conexión abierta a reutilizar (conserva su caché de páginas);
+            si se indica no se cierra aquí y ante un error solo se revierte
 
     Returns:
         Resultado de la transacción
@@ -729,7 +865,7 @@ def execute_transaction_with_retry(transaction_func, *args, **kwargs):
     for attempt in range(MAX_RETRIES):
         conn = None
         try:
-            conn = get_db_connection()
+            conn = shared_conn if shared_conn is not None else get_db_connection()
             if conn is None:
                 raise sqlite3.Error("No se pudo obtener conexión a la base de datos")
 
@@ -750,7 +886,8 @@ def execute_transaction_with_retry(transaction_func, *args, **kwargs):
                     conn.rollback()
                 except:
                     pass
-                conn.close()
+                if conn is not shared_conn:
+                    conn.close()
 
             if (
                 "database is locked" in error_msg 
@@ -784,11 +921,12 @@ def execute_transaction_with_retry(transaction_func, *args, **kwargs):
                     conn.rollback()
                 except:
                     pass
-                conn.close()
+                if conn is not shared_conn:
+                    conn.close()
             logging.error(f"Error en transacción: {e}")
             raise
         finally:
-            if conn:
+            if conn and conn is not shared_conn:
                 conn.close()
 
     raise sqlite3.Error(f"Transacción falló después de {MAX_RETRIES} intentos")